@@ -0,0 +1,119 @@
+"""Кэш результатов запросов и страниц сайта в кэше Django (CACHES в settings.py: в памяти процесса,
+в файлах или в Redis).
+
+Данные меняются только при импорте, поэтому в каждый ключ входит версия данных — число из
+таблицы dataset_version, которое import_books.py увеличивает один раз, в последней транзакции
+импорта. После импорта все ключи разом становятся новыми, а старые записи просто истекают. Версия
+перечитывается из БД не чаще раза в VERSION_CHECK секунд, так что после импорта сайт показывает
+новые данные самое позднее через это время.
+
+Время жизни задаётся для каждого запроса (TTLS) и лишь ограничивает память: устаревшими записи
+делает смена версии. Попадания и промахи считаются по имени запроса в каждом процессе (cache_stats).
+"""
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from . import queries
+from .db_connection import execute_query, had_errors, reset_errors
+
+VERSION_CHECK = 5
+DEFAULT_TTL = 300
+TTLS = {
+    'stats': 600,
+    'recent_books': 600,
+    'count': 600,
+    'latest_page': 300,
+    'search_page': 120,
+    'book': 600,
+    'book_offers': 600,
+    'view:index': 300,
+    'view:search': 120,
+    'view:book_detail': 600,
+}
+
+_version = None
+_version_checked = 0.0
+_counters = defaultdict(lambda: {'hits': 0, 'misses': 0})
+_lock = threading.Lock()
+
+
+def dataset_version():
+    """Версия данных из БД, не чаще раза в VERSION_CHECK секунд"""
+    global _version, _version_checked
+    now = time.monotonic()
+    if _version is None or now - _version_checked >= VERSION_CHECK:
+        row = execute_query(queries.DATASET_VERSION, fetch_one=True, prepared=True)
+        if row:
+            _version = row['version']
+        _version_checked = now
+    return _version
+
+
+def make_key(name, params=()):
+    digest = hashlib.blake2b(repr(tuple(params)).encode('utf-8'), digest_size=16).hexdigest()
+    return f"books:{dataset_version()}:{name}:{digest}"
+
+
+def count(name, hit):
+    with _lock:
+        _counters[name]['hits' if hit else 'misses'] += 1
+
+
+def cache_stats():
+    """Попадания и промахи по именам запросов с начала работы процесса"""
+    with _lock:
+        return {name: dict(values) for name, values in sorted(_counters.items())}
+
+
+def cached_query(name, query, params=None, fetch_one=False, prepared=True):
+    """execute_query с кэшем. Ошибки БД (None) не кэшируются"""
+    if dataset_version() is None:
+        # Версию прочитать не удалось: без неё нельзя понять, не устарела ли запись
+        return execute_query(query, params, fetch_one=fetch_one, prepared=prepared)
+
+    key = make_key(name, [query, fetch_one] + list(params or ()))
+    result = cache.get(key)
+    if result is not None:
+        count(name, True)
+        return result
+    count(name, False)
+    result = execute_query(query, params, fetch_one=fetch_one, prepared=prepared)
+    if result is not None:
+        cache.set(key, result, TTLS.get(name, DEFAULT_TTL))
+    return result
+
+
+def cached_view(view):
+    """Кэширует готовую страницу GET-запроса по полному адресу вместе с её заголовками"""
+    name = f"view:{view.__name__}"
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET' or dataset_version() is None:
+            return view(request, *args, **kwargs)
+
+        # 'headers' в ключе: записи прежнего вида (одно содержимое) из файлов или Redis не читаются
+        key = make_key(name, [request.get_full_path(), 'headers'])
+        cached = cache.get(key)
+        if cached is not None:
+            count(name, True)
+            content, headers = cached
+            response = HttpResponse(content)
+            # Content-Type и прочие заголовки страницы, а не значения HttpResponse по умолчанию
+            for header, value in headers:
+                response[header] = value
+            return response
+        count(name, False)
+        reset_errors()
+        response = view(request, *args, **kwargs)
+        # Страница, собранная при ошибке БД, не кэшируется: иначе пустой список жил бы до конца TTL
+        if response.status_code == 200 and not had_errors():
+            cache.set(key, (response.content, list(response.items())), TTLS.get(name, DEFAULT_TTL))
+        return response
+    return wrapper
@@ -1,4 +1,32 @@
+"""Доступ к MySQL для представлений.
+
+Соединения берутся из пула (MySQLConnectionPool), свой пул у каждого процесса: после fork
+соединения родителя не используются. Пул сам проверяет соединение при выдаче (ping) и
+переподключает оборвавшееся. Во время запроса Django (DbConnectionMiddleware) все запросы идут
+через одно соединение, оно возвращается в пул после ответа; вне запроса соединение возвращается
+сразу после execute_query.
+
+Для постоянных запросов (prepared=True) на каждом соединении держатся подготовленные курсоры:
+MySQL разбирает запрос один раз, дальше передаются только параметры. Поэтому сессия соединения
+при возврате в пул не сбрасывается — сброс удалил бы подготовленные запросы — и включён autocommit,
+чтобы соединение из пула не читало старый снимок данных.
+"""
+import os
+import threading
+
 import mysql.connector
+from mysql.connector import errors
+from mysql.connector.pooling import MySQLConnectionPool
+
+POOL_SIZE = int(os.environ.get('BOOKS_DB_POOL_SIZE', 5))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# connection_id соединения -> {запрос: подготовленный курсор}. После переподключения у соединения
+# новый connection_id, и курсоры старой сессии больше не используются
+_statements = {}
+_local = threading.local()
 
 
 def get_db_config():
@@ -11,21 +39,109 @@ def get_db_config():
     }
 
 
-def execute_query(query, params=None, fetch_one=False):
+def get_pool():
+    global _pool, _pool_pid, _statements
+    pid = os.getpid()
+    if _pool_pid != pid:
+        with _pool_lock:
+            if _pool_pid != pid:
+                _pool = MySQLConnectionPool(pool_name=f'books_{pid}', pool_size=POOL_SIZE,
+                                            pool_reset_session=False, autocommit=True, **get_db_config())
+                _statements = {}
+                _pool_pid = pid
+    return _pool
+
+
+def _checkout():
     try:
-        conn = mysql.connector.connect(**get_db_config())
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(query, params or ())
+        return get_pool().get_connection()
+    except errors.PoolError:
+        # Все соединения пула заняты: запрос не ждёт, а идёт через отдельное соединение
+        return mysql.connector.connect(autocommit=True, **get_db_config())
 
-        if fetch_one:
-            result = cursor.fetchone()
-        else:
-            result = cursor.fetchall()
 
-        cursor.close()
+def get_connection():
+    """Соединение текущего запроса Django или новое из пула; второе значение — вернуть ли его
+    в пул сразу после использования"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        return conn, False
+    conn = _checkout()
+    if getattr(_local, 'in_request', False):
+        _local.conn = conn
+        return conn, False
+    return conn, True
+
+
+def begin_request():
+    _local.in_request = True
+    _local.failed = False
+
+
+def end_request():
+    _local.in_request = False
+    conn = getattr(_local, 'conn', None)
+    _local.conn = None
+    if conn is not None:
         conn.close()
-        return result
+
+
+def _prepared_cursor(conn, query):
+    cursors = _statements.get(conn.connection_id)
+    if cursors is None:
+        if len(_statements) > POOL_SIZE * 4:
+            # Записи о закрытых и переподключённых соединениях
+            _statements.clear()
+        cursors = _statements[conn.connection_id] = {}
+    cursor = cursors.get(query)
+    if cursor is None:
+        cursor = cursors[query] = conn.cursor(prepared=True)
+    return cursor
+
+
+def reset_errors():
+    _local.failed = False
+
+
+def had_errors():
+    """Был ли с последнего reset_errors() (или с начала запроса Django) запрос с ошибкой"""
+    return getattr(_local, 'failed', False)
+
+
+def _forget(conn):
+    _local.conn = None
+    try:
+        _statements.pop(conn.connection_id, None)
+        conn.close()
+    except errors.Error:
+        pass
+
+
+def execute_query(query, params=None, fetch_one=False, prepared=False):
+    conn = None
+    try:
+        conn, release = get_connection()
+        if prepared:
+            cursor = _prepared_cursor(conn, query)
+            cursor.execute(query, tuple(params or ()))
+            columns = cursor.column_names
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        else:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(query, params or ())
+            rows = cursor.fetchall()
+            cursor.close()
+
+        if release:
+            conn.close()
+        if fetch_one:
+            return rows[0] if rows else None
+        return rows
 
     except Exception as e:
         print(f"Ошибка БД: {e}")
-        return None
\ No newline at end of file
+        _local.failed = True
+        if conn is not None:
+            # Соединение могло остаться в неизвестном состоянии: пул проверит его при следующей выдаче
+            _forget(conn)
+        return None
@@ -0,0 +1,16 @@
+from .db_connection import begin_request, end_request
+
+
+class DbConnectionMiddleware:
+    """Одно соединение с БД на весь запрос: берётся из пула при первом запросе к БД и
+    возвращается после ответа"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        begin_request()
+        try:
+            return self.get_response(request)
+        finally:
+            end_request()
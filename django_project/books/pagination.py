@@ -0,0 +1,110 @@
+"""Постраничный вывод по ключу (keyset): следующая страница — строки после последней строки текущей
+по ключу сортировки и id, а не OFFSET. MySQL сразу переходит к нужному месту индекса, поэтому
+страница 500 стоит столько же, сколько первая.
+
+Ссылки на страницы — курсоры: ключ сортировки и id крайней строки и номер страницы для подписи.
+Запросы одного списка лежат в словаре queries.py с ключами:
+  first  — первая страница; параметры: (...общие, limit)
+  after  — после курсора;   параметры: (...общие, ключ, ключ, id, limit)
+  before — перед курсором, в обратном порядке; те же параметры
+  last   — последняя страница, в обратном порядке; параметры: (...общие, limit)
+
+Последняя страница берёт столько строк, сколько остаётся после полных страниц, чтобы её граница
+совпадала с той, до которой доходят кнопкой «Далее». Поэтому она доступна, только когда известно число строк.
+
+Страницы и число найденных книг кэшируются (cache.py). Число считается не дальше COUNT_LIMIT.
+"""
+import base64
+import json
+import math
+from datetime import date, datetime
+from decimal import Decimal
+
+from .cache import cached_query
+
+PER_PAGE = 20
+COUNT_LIMIT = 1000
+
+
+def encode_cursor(key, row_id, number):
+    if isinstance(key, (date, datetime)):
+        key = key.isoformat(sep=' ')
+    elif isinstance(key, Decimal):
+        # Строкой, чтобы оценка вернулась в запрос точно такой же
+        key = str(key)
+    data = json.dumps([key, row_id, number], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """(ключ, id, номер страницы) или None, если курсор испорчен"""
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        key, row_id, number = json.loads(data)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(row_id, int) or not (number is None or isinstance(number, int)):
+        return None
+    return key, row_id, number
+
+
+def cached_count(sql, params=()):
+    """Число строк по запросу COUNT из кэша"""
+    result = cached_query('count', sql, list(params), fetch_one=True)
+    return result['total'] if result else 0
+
+
+class Page:
+    def __init__(self, books, number, num_pages, has_previous, has_next, sort_field):
+        self.books = books
+        self.number = number
+        self.num_pages = num_pages
+        self.has_previous = has_previous
+        self.has_next = has_next
+        self.previous_cursor = self.next_cursor = None
+        if books:
+            previous_number = number - 1 if number else None
+            next_number = number + 1 if number else None
+            self.previous_cursor = encode_cursor(books[0][sort_field], books[0]['id'], previous_number)
+            self.next_cursor = encode_cursor(books[-1][sort_field], books[-1]['id'], next_number)
+
+    @property
+    def is_paginated(self):
+        return self.has_previous or self.has_next
+
+
+def keyset_page(name, sql, params, sort_field, total, after=None, before=None, last=False, per_page=PER_PAGE):
+    """Страница списка. name — имя для кэша, sql — словарь запросов (см. описание модуля), total — число
+    строк или None, если оно больше COUNT_LIMIT и точно не считалось"""
+    params = list(params)
+    num_pages = max(1, math.ceil(total / per_page)) if total is not None else None
+    cursor = decode_cursor(after or before or '')
+
+    if cursor and after:
+        key, row_id, number = cursor
+        rows = cached_query(name, sql['after'], params + [key, key, row_id, per_page + 1]) or []
+        has_previous, has_next = True, len(rows) > per_page
+        rows = rows[:per_page]
+    elif cursor:
+        key, row_id, number = cursor
+        rows = cached_query(name, sql['before'], params + [key, key, row_id, per_page + 1]) or []
+        has_previous, has_next = len(rows) > per_page, True
+        rows = rows[:per_page][::-1]
+    elif last and num_pages is not None:
+        last_size = total - (num_pages - 1) * per_page
+        rows = cached_query(name, sql['last'], params + [last_size + 1]) or []
+        has_previous, has_next = len(rows) > last_size, False
+        rows = rows[:last_size][::-1]
+        number = num_pages
+    else:
+        rows = cached_query(name, sql['first'], params + [per_page + 1]) or []
+        has_previous, has_next = False, len(rows) > per_page
+        rows = rows[:per_page]
+        number = 1
+
+    # Номер страницы из курсора только подпись: после изменения данных он может сбиться
+    if number is not None and num_pages is not None:
+        number = max(1, min(number, num_pages))
+    if not has_previous:
+        number = 1
+    return Page(rows, number, num_pages, has_previous, has_next, sort_field)
@@ -0,0 +1,131 @@
+"""SQL-запросы сайта. Лежат отдельно от представлений, чтобы parsers/schema.py мог проверить
+их планы (python schema.py explain) без Django. Индексы, на которые они рассчитаны, создаёт schema.py"""
+
+STATS = """
+    SELECT
+        (SELECT COUNT(*) FROM products) as total_books,
+        (SELECT COUNT(*) FROM offers WHERE is_stale = 0) as total_offers
+"""
+
+# Списки товаров читают сводку цен из products (min_price, offers_count), её ведёт import_books.py,
+# поэтому JOIN и GROUP BY по offers не нужны, а порядок даёт индекс
+RECENT_BOOKS = """
+    SELECT * FROM products
+    ORDER BY created_at DESC
+    LIMIT 10
+"""
+
+# Полнотекстовый поиск (search_backend.py): параметр — запрос в синтаксисе BOOLEAN MODE.
+# Совпадение в названии (индекс products_search_title) весит вдвое больше, чем в авторе и издательстве.
+# Оценка округляется до DECIMAL: курсор страниц сравнивает её на равенство, а у FLOAT после
+# передачи через курсор последние разряды расходятся, и книги с равной оценкой терялись или повторялись
+SEARCH_RANKED = """
+    SELECT p.*,
+        CAST(MATCH(canonical_name) AGAINST (%s IN BOOLEAN MODE) * 2
+             + MATCH(canonical_name, author, publisher) AGAINST (%s IN BOOLEAN MODE) AS DECIMAL(14, 6)) AS relevance
+    FROM products p
+    WHERE MATCH(canonical_name, author, publisher) AGAINST (%s IN BOOLEAN MODE)
+"""
+
+# Страницы по ключу (relevance DESC, id), см. pagination.py. Ключ курсора приходит строкой,
+# CAST сравнивает его с оценкой как DECIMAL, а не как число с плавающей точкой
+SEARCH_PAGES = {
+    'first': f"""
+        SELECT * FROM ({SEARCH_RANKED}) r
+        ORDER BY relevance DESC, id
+        LIMIT %s
+    """,
+    'after': f"""
+        SELECT * FROM ({SEARCH_RANKED}) r
+        WHERE relevance < CAST(%s AS DECIMAL(14, 6))
+            OR (relevance = CAST(%s AS DECIMAL(14, 6)) AND id > %s)
+        ORDER BY relevance DESC, id
+        LIMIT %s
+    """,
+    'before': f"""
+        SELECT * FROM ({SEARCH_RANKED}) r
+        WHERE relevance > CAST(%s AS DECIMAL(14, 6))
+            OR (relevance = CAST(%s AS DECIMAL(14, 6)) AND id < %s)
+        ORDER BY relevance, id DESC
+        LIMIT %s
+    """,
+    'last': f"""
+        SELECT * FROM ({SEARCH_RANKED}) r
+        ORDER BY relevance, id DESC
+        LIMIT %s
+    """,
+}
+
+# Считает не больше заданного числа книг: для частых слов точное число не нужно
+SEARCH_COUNT = """
+    SELECT COUNT(*) as total FROM (
+        SELECT 1 FROM products
+        WHERE MATCH(canonical_name, author, publisher) AGAINST (%s IN BOOLEAN MODE)
+        LIMIT %s
+    ) t
+"""
+
+# Поиск по ISBN; {placeholders} — по одному %s на ISBN
+SEARCH_ISBN = """
+    SELECT DISTINCT p.* FROM product_isbns i
+    JOIN products p ON p.id = i.product_id
+    WHERE i.isbn IN ({placeholders})
+    ORDER BY p.id
+"""
+
+# Страницы каталога без запроса по ключу (created_at DESC, id DESC): индекс products(created_at)
+# содержит и id, так что переход к курсору — поиск по индексу
+LATEST_PAGES = {
+    'first': """
+        SELECT * FROM products
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """,
+    'after': """
+        SELECT * FROM products
+        WHERE created_at < %s OR (created_at = %s AND id < %s)
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """,
+    'before': """
+        SELECT * FROM products
+        WHERE created_at > %s OR (created_at = %s AND id > %s)
+        ORDER BY created_at, id
+        LIMIT %s
+    """,
+    'last': """
+        SELECT * FROM products
+        ORDER BY created_at, id
+        LIMIT %s
+    """,
+}
+
+LATEST_COUNT = "SELECT COUNT(*) as total FROM products"
+
+BOOK = "SELECT * FROM products WHERE id = %s"
+
+# Версия данных для ключей кэша (cache.py), её увеличивает import_books.py
+DATASET_VERSION = "SELECT version FROM dataset_version WHERE id = 1"
+
+# Индекс offers(product_id, price) отдаёт предложения товара уже по цене
+BOOK_OFFERS = """
+    SELECT * FROM offers
+    WHERE product_id = %s AND is_stale = 0
+    ORDER BY price
+"""
+
+# Для python schema.py explain: (название, запрос, параметры, таблицы, которые можно читать целиком)
+EXPLAIN_CHECKS = [
+    ('статистика', STATS, (), ('offers',)),
+    ('последние книги', RECENT_BOOKS, (), ()),
+    ('поиск', SEARCH_PAGES['first'], ('+книг',) * 3 + (21,), ()),
+    ('поиск: после курсора', SEARCH_PAGES['after'], ('+книг',) * 3 + ('1.500000', '1.500000', 100, 21), ()),
+    ('поиск: число книг', SEARCH_COUNT, ('+книг', 1001), ()),
+    ('поиск по ISBN', SEARCH_ISBN.format(placeholders='%s'), ('9785170000000',), ()),
+    ('каталог', LATEST_PAGES['first'], (21,), ()),
+    ('каталог: после курсора', LATEST_PAGES['after'], ('2024-01-01 00:00:00', '2024-01-01 00:00:00', 100, 21), ()),
+    ('каталог: последняя страница', LATEST_PAGES['last'], (21,), ()),
+    ('книга', BOOK, (1,), ()),
+    ('версия данных', DATASET_VERSION, (), ()),
+    ('предложения книги', BOOK_OFFERS, (1,), ()),
+]
@@ -0,0 +1,107 @@
+"""Поиск книг по названию, автору, издательству и ISBN.
+
+Текстовый поиск идёт по индексам FULLTEXT с парсером ngram (создаёт parsers/schema.py): MySQL
+режет текст на пары символов, поэтому кириллица ищется без словаря, а слово запроса находится
+внутри любого слова названия. Формы слова сводятся к общей основе облегчённым стеммером: от слова
+запроса отрезается падежное окончание, и «пушкина», «войны», «мастера» находят «Пушкин», «Война»,
+«Мастер и Маргарита». Результаты упорядочены по релевантности: совпадение в названии весит вдвое
+больше, чем в авторе или издательстве. Если все слова запроса вместе не нашлись, ищется любое из них.
+
+Запрос, в котором есть ISBN (10 или 13 цифр, с дефисами или без), ищется по таблице product_isbns.
+ISBN из запроса приводятся к виду хранения тем же parsers/isbn.py, что и при импорте.
+Страницы результатов выбираются по ключу (relevance, id), см. pagination.py.
+"""
+import importlib.util
+import os
+import re
+
+from . import queries
+from .cache import cached_query
+from .pagination import COUNT_LIMIT, PER_PAGE, Page, cached_count, keyset_page
+
+ISBN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'parsers', 'isbn.py')
+
+
+def load_isbn():
+    """Модуль parsers/isbn.py; грузится по пути, как queries.py в parsers/schema.py"""
+    spec = importlib.util.spec_from_file_location('parsers_isbn', ISBN_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+isbn = load_isbn()
+
+WORD_RE = re.compile(r'\w+')
+
+# Окончания от длинных к коротким; отрезается одно, основа остаётся не короче MIN_STEM букв
+ENDINGS = sorted([
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ией', 'ой', 'ей', 'ий', 'ый', 'ая',
+    'яя', 'ое', 'ее', 'ые', 'ие', 'ую', 'юю', 'ов', 'ев', 'ом', 'ем', 'ах', 'ях', 'ам', 'ям', 'ию', 'ия',
+    'ья', 'ье', 'ью', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+], key=len, reverse=True)
+MIN_STEM = 3
+# Пары символов: слово из одной буквы индекс ngram не находит
+MIN_WORD = 2
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    if not re.fullmatch(r'[а-я]+', word):
+        return word
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def query_terms(query):
+    terms = []
+    for word in WORD_RE.findall(query):
+        term = stem(word)
+        if len(term) >= MIN_WORD and term not in terms:
+            terms.append(term)
+    return terms
+
+
+def boolean_query(terms, require_all=True):
+    """Запрос для MATCH ... IN BOOLEAN MODE. С парсером ngram каждое слово ищется как фраза из
+    пар символов, то есть как подстрока"""
+    return ' '.join(f"+{term}" if require_all else term for term in terms)
+
+
+def query_isbns(query):
+    """ISBN из запроса в виде ISBN-13, как они хранятся в product_isbns. Номера с неверной
+    контрольной цифрой отбрасываются, и такой запрос ищется как текст"""
+    return isbn.canonical_isbns(query)
+
+
+def search_isbn(isbns):
+    placeholders = ', '.join(['%s'] * len(isbns))
+    return cached_query('search_isbn', queries.SEARCH_ISBN.format(placeholders=placeholders), isbns,
+                        prepared=False) or []
+
+
+def search_books(query, after=None, before=None, last=False, per_page=PER_PAGE):
+    """Страница книг по запросу, от самых подходящих, и число найденных книг (None — больше COUNT_LIMIT)"""
+    isbns = query_isbns(query)
+    if isbns:
+        # По ISBN находятся единицы книг, они выводятся одной страницей
+        books = search_isbn(isbns)
+        if books:
+            return Page(books, 1, 1, False, False, 'id'), len(books)
+
+    terms = query_terms(query)
+    if not terms:
+        return Page([], 1, 1, False, False, 'id'), 0
+
+    for require_all in ((True, False) if len(terms) > 1 else (True,)):
+        against = boolean_query(terms, require_all)
+        total = cached_count(queries.SEARCH_COUNT, (against, COUNT_LIMIT + 1))
+        if total:
+            if total > COUNT_LIMIT:
+                total = None
+            page = keyset_page('search_page', queries.SEARCH_PAGES, [against] * 3, 'relevance', total,
+                               after, before, last, per_page)
+            return page, total
+    return Page([], 1, 1, False, False, 'id'), 0
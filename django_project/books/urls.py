@@ -5,4 +5,5 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('search/', views.search, name='search'),
     path('book/<int:book_id>/', views.book_detail, name='book_detail'),
+    path('cache/stats/', views.cache_statistics, name='cache_statistics'),
 ]
\ No newline at end of file
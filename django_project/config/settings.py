@@ -14,6 +14,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
+    'books.middleware.DbConnectionMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -43,4 +44,25 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
+# Кэш запросов и страниц (books/cache.py). По умолчанию — в памяти процесса;
+# BOOKS_CACHE_URL=file:///путь/к/папке — в файлах, общий для процессов сервера;
+# BOOKS_CACHE_URL=redis://localhost:6379/0 — в Redis (нужен пакет redis)
+BOOKS_CACHE_URL = os.environ.get('BOOKS_CACHE_URL', '')
+if BOOKS_CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': BOOKS_CACHE_URL,
+    }}
+elif BOOKS_CACHE_URL.startswith('file://'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BOOKS_CACHE_URL[len('file://'):],
+    }}
+else:
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'books',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }}
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -0,0 +1,121 @@
+"""Скорость и качество поиска дублей книг по названию и автору на данных из data/.
+
+Книги проходят по порядку, как при импорте: каждая ищется среди уже добавленных товаров
+без учёта ISBN, а не найденная становится новым товаром. Правильный ответ даёт ISBN: если
+книга с тем же ISBN уже встречалась, совпадение должно найтись (полнота), а найденный товар
+должен иметь тот же ISBN (точность). Разные издания одной книги (одинаковые название и автор,
+но разные ISBN) считаются верным совпадением: импорт и раньше объединял их в один товар.
+Сравниваются прежний способ (вхождение строки в первые 5 кандидатов, как делал LIKE ... LIMIT 5)
+и MinHash LSH из fuzzy_match.py с разными порогами.
+Запуск: python bench_dedup.py [файл] [--thresholds 0.5,0.6,0.7,0.75] [--scale N] [--skip-legacy]
+"""
+import argparse
+import time
+
+from fuzzy_match import FuzzyIndex, normalize_for_comparison
+from isbn import book_isbns
+from merge_data import iter_books
+
+
+def book_isbn(book):
+    isbns = book_isbns(book)
+    return isbns[0] if isbns else ''
+
+
+def load_records(path, scale):
+    books = [(normalize_for_comparison(book.get('title', '')), normalize_for_comparison(book.get('author', '')),
+              book_isbn(book)) for book in iter_books(path)]
+    records = list(books)
+    # Копии с другим номером в названии и другим ISBN: объём растёт, а дублей между копиями нет
+    for copy in range(1, scale):
+        records.extend((f"{title} {copy}", author, f"{isbn}-{copy}" if isbn else '')
+                       for title, author, isbn in books)
+    return records
+
+
+class LegacyMatcher:
+    """Прежний поиск: первые 5 товаров, в названии которых есть искомое, и проверка вхождения"""
+
+    def __init__(self):
+        self.products = []
+
+    def best(self, title, author):
+        title_nospace = title.replace(' ', '')
+        candidates = [(key, cand_title, cand_author) for key, cand_title, cand_author in self.products
+                      if title_nospace in cand_title.replace(' ', '') or title in cand_title][:5]
+        for key, cand_title, cand_author in candidates:
+            if (title in cand_title or cand_title in title) and \
+                    (author in cand_author or cand_author in author):
+                return key
+        return None
+
+    def add(self, key, title, author):
+        self.products.append((key, title, author))
+
+
+def evaluate(matcher, records):
+    product_isbns = []
+    product_names = []
+    seen_isbns = set()
+    expected = found = matched = recalled = correct = 0
+
+    start = time.perf_counter()
+    for title, author, isbn in records:
+        key = matcher.best(title, author) if title and author else None
+        if isbn and isbn in seen_isbns:
+            expected += 1
+        if key is None:
+            key = len(product_isbns)
+            product_isbns.append(set())
+            product_names.append((title, author))
+            if title and author:
+                matcher.add(key, title, author)
+        else:
+            matched += 1
+            if isbn and product_isbns[key]:
+                found += 1
+                same_isbn = isbn in product_isbns[key]
+                recalled += same_isbn
+                correct += same_isbn or product_names[key] == (title, author)
+        if isbn:
+            product_isbns[key].add(isbn)
+            seen_isbns.add(isbn)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'records': len(records),
+        'products': len(product_isbns),
+        'matched': matched,
+        'recall': recalled / expected if expected else 0.0,
+        'precision': correct / found if found else 0.0,
+        'records_per_sec': len(records) / elapsed if elapsed else 0.0,
+        'seconds': elapsed,
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('path', nargs='?', default='../data/all_books_raw.json')
+    arg_parser.add_argument('--thresholds', default='0.5,0.6,0.7,0.75', help='пороги сходства названий через запятую')
+    arg_parser.add_argument('--scale', type=int, default=1, help='размножить данные в N раз для замера скорости')
+    arg_parser.add_argument('--skip-legacy', action='store_true', help='не запускать прежний способ (он квадратичный)')
+    args = arg_parser.parse_args()
+
+    records = load_records(args.path, args.scale)
+    print(f"Книг: {len(records)}")
+
+    runs = []
+    if not args.skip_legacy:
+        runs.append(('вхождение, LIMIT 5', LegacyMatcher()))
+    for threshold in (float(value) for value in args.thresholds.split(',')):
+        runs.append((f"minhash, порог {threshold:.2f}", FuzzyIndex(threshold=threshold)))
+
+    print(f"{'способ':<22}{'товаров':>9}{'совпало':>9}{'полнота':>9}{'точность':>10}{'книг/с':>10}{'время, с':>10}")
+    for name, matcher in runs:
+        result = evaluate(matcher, records)
+        print(f"{name:<22}{result['products']:>9}{result['matched']:>9}{result['recall']:>9.3f}"
+              f"{result['precision']:>10.3f}{result['records_per_sec']:>10.0f}{result['seconds']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Сравнение скорости разбора HTML разными бэкендами на сохранённых страницах.
+
+Страницы лежат в fixtures/html/<магазин>/<catalog|detail>/*.html, например
+fixtures/html/labirint/detail/123.html. В репозитории лежит небольшой набор: по странице каталога
+и по три детальные страницы каждого магазина. Они повторяют разметку, которую читают парсеры,
+а шапка, меню, подвал и встроенный JSON добавлены, чтобы частичный разбор было с чем сравнить.
+Для замеров на настоящих страницах подходит и запись парсеров (--record, см. replay.py):
+python crawl_all.py --record fixtures/replay, затем python bench_html.py fixtures/replay.
+Запуск: python bench_html.py [каталог] [--repeat N]
+"""
+import argparse
+import os
+import statistics
+import time
+
+from html_backend import available_backends, make_soup
+from parsing import ChitaiGorodParser
+from parsing_bookvoed import BookvoedParser
+from parsing_labirint import LabirintParser
+from replay import FixtureStore
+
+SHOPS = {
+    'chitai-gorod': ChitaiGorodParser,
+    'bookvoed': BookvoedParser,
+    'labirint': LabirintParser,
+}
+# Типы страниц в записи --record
+RECORDED_TYPES = {
+    'catalog': ('catalog', 'prices'),
+    'detail': ('detail', 'product'),
+}
+
+
+def load_recorded_pages(store, page_type):
+    pages = []
+    for entry in store.entries():
+        if entry['page_type'] in RECORDED_TYPES[page_type]:
+            with open(os.path.join(store.fixtures_dir, entry['key'] + '.html'), 'r', encoding='utf-8') as f:
+                pages.append((entry['url'], f.read()))
+    return pages
+
+
+def load_pages(fixtures_dir, shop, page_type):
+    store = FixtureStore(os.path.join(fixtures_dir, shop))
+    if os.path.exists(store.index_path):
+        return load_recorded_pages(store, page_type)
+
+    pages_dir = os.path.join(fixtures_dir, shop, page_type)
+    if not os.path.isdir(pages_dir):
+        return []
+    pages = []
+    for name in sorted(os.listdir(pages_dir)):
+        if name.endswith('.html'):
+            with open(os.path.join(pages_dir, name), 'r', encoding='utf-8') as f:
+                pages.append((name, f.read()))
+    return pages
+
+
+def time_parse(markup, parse_only, backend, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        make_soup(markup, parse_only, backend)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def run(fixtures_dir, repeat):
+    backends = available_backends()
+    print(f"{'магазин':<14}{'страницы':<10}{'бэкенд':<13}{'дерево':<10}{'мс/стр':>9}{'ускорение':>11}")
+
+    for shop, parser_cls in SHOPS.items():
+        parser = parser_cls(cache_dir=None)
+        for page_type in ('catalog', 'detail'):
+            pages = load_pages(fixtures_dir, shop, page_type)
+            if not pages:
+                continue
+
+            baseline = None
+            for backend in backends:
+                for scoped in (False, True):
+                    parse_only = parser.PAGE_SCOPES[page_type] if scoped else None
+                    total = sum(time_parse(markup, parse_only, backend, repeat) for _, markup in pages)
+                    ms_per_page = total / len(pages) * 1000
+                    baseline = baseline or ms_per_page
+                    print(f"{shop:<14}{page_type:<10}{backend:<13}{'частично' if scoped else 'полное':<10}"
+                          f"{ms_per_page:>9.2f}{baseline / ms_per_page:>10.1f}x")
+
+            # Частичный разбор не должен менять извлечённые данные
+            if page_type == 'detail':
+                for name, markup in pages:
+                    expected = parser.extract_book_details(make_soup(markup, None, 'html.parser'), name)
+                    for backend in backends:
+                        soup = make_soup(markup, parser.PAGE_SCOPES['detail'], backend)
+                        if parser.extract_book_details(soup, name) != expected:
+                            print(f"  расхождение данных: {shop}/{name} ({backend})")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('fixtures_dir', nargs='?', default=os.path.join('fixtures', 'html'))
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+    run(args.fixtures_dir, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Пропускная способность парсеров на записанных страницах, без сети.
+
+Страницы записываются флагом --record у парсеров или crawl_all.py, например
+python parsing.py --record fixtures/replay/chitai-gorod. Для каждого магазина из
+fixtures/replay/<магазин> прогоняются parse_catalog_cards и parse_book_details,
+выводятся страницы в секунду, мс на страницу и пиковое потребление памяти.
+Каждый магазин измеряется в отдельном процессе, чтобы память не смешивалась.
+Запуск: python bench_parsers.py [каталог] [--repeat N] [--json результат.json]
+"""
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from replay import replay
+
+SHOP_PARSERS = {
+    'chitai-gorod': ('parsing', 'ChitaiGorodParser'),
+    'bookvoed': ('parsing_bookvoed', 'BookvoedParser'),
+    'labirint': ('parsing_labirint', 'LabirintParser'),
+}
+
+
+def bench_shop(shop, fixtures_dir, repeat):
+    module_name, class_name = SHOP_PARSERS[shop]
+    parser_cls = getattr(importlib.import_module(module_name), class_name)
+    parser = parser_cls(cache_dir=None)
+    store = replay(parser, fixtures_dir)
+    entries = store.entries()
+
+    timings = {'catalog': [], 'detail': []}
+    for _ in range(repeat):
+        # Лабиринт пропускает уже виденные ссылки, для повторных прогонов список сбрасывается
+        if hasattr(parser, 'seen_urls'):
+            parser.seen_urls.clear()
+        for entry in entries:
+            start = time.perf_counter()
+            if entry['page_type'] in ('catalog', 'prices') and entry['page'] is not None:
+                parser.parse_catalog_cards(entry['page'])
+                timings['catalog'].append(time.perf_counter() - start)
+            elif entry['page_type'] == 'detail':
+                parser.parse_book_details(entry['url'])
+                timings['detail'].append(time.perf_counter() - start)
+            elif entry['page_type'] == 'product':
+                parser.map_products([entry['url']])
+                timings['detail'].append(time.perf_counter() - start)
+
+    parser.engine.shutdown()
+    result = {'shop': shop, 'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+    for page_type, values in timings.items():
+        total = sum(values)
+        result[page_type] = {
+            'pages': len(values),
+            'pages_per_sec': len(values) / total if total else 0.0,
+            'ms_per_page': total / len(values) * 1000 if values else 0.0,
+        }
+    return result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('fixtures_dir', nargs='?', default=os.path.join('fixtures', 'replay'))
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--json', help='сохранить результаты в JSON-файл')
+    args = arg_parser.parse_args()
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for shop in SHOP_PARSERS:
+        shop_dir = os.path.join(args.fixtures_dir, shop)
+        if not os.path.isdir(shop_dir):
+            continue
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results.append(executor.submit(bench_shop, shop, shop_dir, args.repeat).result())
+
+    if not results:
+        print(f"Нет записанных страниц в {args.fixtures_dir}")
+        return
+
+    print(f"{'магазин':<14}{'страницы':<10}{'кол-во':>8}{'стр/с':>10}{'мс/стр':>10}{'пик RSS, МБ':>14}")
+    for result in results:
+        for page_type in ('catalog', 'detail'):
+            stats = result[page_type]
+            if stats['pages']:
+                print(f"{result['shop']:<14}{page_type:<10}{stats['pages']:>8}{stats['pages_per_sec']:>10.1f}"
+                      f"{stats['ms_per_page']:>10.2f}{result['peak_rss_mb']:>14.1f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
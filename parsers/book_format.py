@@ -0,0 +1,187 @@
+"""Компактный двоичный формат набора книг (*.books) для передачи между merge_data.py и import_books.py.
+
+Файл: заголовок (сигнатура, версия, флаги, схема полей), затем блоки по BLOCK_RECORDS книг.
+Блок — число книг, длина данных до и после сжатия и сами данные (zlib, если включено сжатие).
+Внутри блока данные лежат по столбцам: строки одного поля через '\\0', цены массивом целых
+копеек. Такой блок разбирается несколькими вызовами split и zip, без цикла по каждому полю.
+Схема хранится в заголовке, поэтому читатель понимает файлы с другим набором полей.
+"""
+import struct
+import sys
+import zlib
+from array import array
+
+EXTENSION = '.books'
+MAGIC = b'BKVL'
+VERSION = 1
+FLAG_ZLIB = 1
+
+# Поля книги: 's' — строка UTF-8, 'p' — цена (хранится целым числом копеек)
+FIELDS = (
+    ('title', 's'),
+    ('author', 's'),
+    ('isbn', 's'),
+    ('isbn_clean', 's'),
+    ('price', 'p'),
+    ('old_price', 'p'),
+    ('discount', 's'),
+    ('publisher', 's'),
+    ('year', 's'),
+    ('genre', 's'),
+    ('description', 's'),
+    ('url', 's'),
+    ('image_url', 's'),
+    ('city', 's'),
+    ('source', 's'),
+)
+
+HEADER = struct.Struct('<4sBBH')
+BLOCK = struct.Struct('<III')
+SIZE = struct.Struct('<I')
+BLOCK_RECORDS = 1024
+
+# Поля нет в книге: в строковом столбце — этот символ, в столбце цен — это число
+MISSING_STR = '\x01'
+MISSING_PRICE = -2
+EMPTY_PRICE = -1
+
+
+def is_book_file(path):
+    return path.endswith(EXTENSION)
+
+
+def price_to_kopecks(value):
+    if value is None:
+        return MISSING_PRICE
+    if value == '':
+        return EMPTY_PRICE
+    try:
+        return round(float(value) * 100)
+    except (TypeError, ValueError):
+        raise ValueError(f"цена не число: {value!r}")
+
+
+def kopecks_to_price(kopecks):
+    if kopecks == MISSING_PRICE:
+        return None
+    if kopecks == EMPTY_PRICE:
+        return ''
+    rubles, rest = divmod(kopecks, 100)
+    # Цены в JSON хранятся строками, как их отдаёт clean_price: '369' или '369.5'
+    return str(rubles) if not rest else f"{kopecks / 100:g}"
+
+
+def to_column_str(value):
+    if value is None:
+        return MISSING_STR
+    # '\0' разделяет значения в столбце, в тексте книги ему взяться неоткуда
+    return str(value).replace('\0', '')
+
+
+class BookWriter:
+    """Пишет книги в двоичный файл блоками по block_records книг"""
+
+    def __init__(self, path, compress=True, block_records=BLOCK_RECORDS):
+        self.path = path
+        self.compress = compress
+        self.block_records = block_records
+        self.count = 0
+        self.file = None
+        self.columns = [[] for _ in FIELDS]
+
+    def __enter__(self):
+        self.file = open(self.path, 'wb')
+        schema = '\0'.join(f"{name}:{kind}" for name, kind in FIELDS).encode('utf-8')
+        self.file.write(HEADER.pack(MAGIC, VERSION, FLAG_ZLIB if self.compress else 0, len(FIELDS)))
+        self.file.write(SIZE.pack(len(schema)) + schema)
+        return self
+
+    def write(self, book):
+        # Сначала преобразуется вся строка: если поле не подходит (цена не число), ValueError
+        # не оставит в колонках половину книги, и следующие книги не сдвинутся
+        row = [price_to_kopecks(book.get(name)) if kind == 'p' else to_column_str(book.get(name))
+               for name, kind in FIELDS]
+        for column, value in zip(self.columns, row):
+            column.append(value)
+        self.count += 1
+        if len(self.columns[0]) >= self.block_records:
+            self.flush_block()
+
+    def flush_block(self):
+        count = len(self.columns[0])
+        if not count:
+            return
+        parts = []
+        for column, (_, kind) in zip(self.columns, FIELDS):
+            if kind == 'p':
+                values = array('q', column)
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                data = values.tobytes()
+            else:
+                data = '\0'.join(column).encode('utf-8')
+            parts.append(SIZE.pack(len(data)))
+            parts.append(data)
+        raw = b''.join(parts)
+        data = zlib.compress(raw, 6) if self.compress else raw
+        self.file.write(BLOCK.pack(count, len(raw), len(data)))
+        self.file.write(data)
+        self.columns = [[] for _ in FIELDS]
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush_block()
+        self.file.close()
+
+
+def read_books(path):
+    """Книги из двоичного файла по одной; в памяти держится только текущий блок"""
+    with open(path, 'rb') as f:
+        magic, version, flags, field_count = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path}: не файл книг")
+        if version > VERSION:
+            raise ValueError(f"{path}: версия формата {version} не поддерживается")
+        (schema_len,) = SIZE.unpack(f.read(SIZE.size))
+        fields = [tuple(item.split(':')) for item in f.read(schema_len).decode('utf-8').split('\0')]
+        if len(fields) != field_count:
+            raise ValueError(f"{path}: повреждена схема полей")
+        names = [name for name, _ in fields]
+
+        while True:
+            block_header = f.read(BLOCK.size)
+            if not block_header:
+                return
+            if len(block_header) < BLOCK.size:
+                raise ValueError(f"{path}: файл обрезан")
+            count, raw_len, data_len = BLOCK.unpack(block_header)
+            data = f.read(data_len)
+            if len(data) < data_len:
+                raise ValueError(f"{path}: файл обрезан")
+            if flags & FLAG_ZLIB:
+                data = zlib.decompress(data, bufsize=raw_len)
+
+            view = memoryview(data)
+            offset = 0
+            columns = []
+            for _, kind in fields:
+                (size,) = SIZE.unpack_from(data, offset)
+                offset += SIZE.size
+                chunk = view[offset:offset + size]
+                offset += size
+                if kind == 'p':
+                    values = array('q')
+                    values.frombytes(chunk)
+                    if sys.byteorder == 'big':
+                        values.byteswap()
+                    columns.append([kopecks_to_price(value) for value in values])
+                else:
+                    columns.append(str(chunk, 'utf-8').split('\0'))
+
+            books = [dict(zip(names, row)) for row in zip(*columns)]
+            # Отсутствующие поля удаляются из словарей, чтобы книга совпала с исходной
+            for name, column in zip(names, columns):
+                if MISSING_STR in column or None in column:
+                    for book, value in zip(books, column):
+                        if value is None or value == MISSING_STR:
+                            del book[name]
+            yield from books
@@ -0,0 +1,180 @@
+import json
+import os
+
+
+class CrawlCheckpoint:
+    """Состояние прерванного обхода: завершённые страницы каталога и уже сохранённые ссылки.
+    Обход по sitemap хранит вместо страниц адреса готовых вложенных sitemap и отпечатки готовых порций"""
+
+    def __init__(self, path):
+        self.path = path
+        self.completed_pages = set()
+        self.seen_urls = set()
+        self.completed_sitemaps = set()
+        self.completed_shards = set()
+        self.exists = os.path.exists(path)
+
+        if self.exists:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                self.completed_pages = set(state.get('completed_pages', []))
+                self.seen_urls = set(state.get('seen_urls', []))
+                self.completed_sitemaps = set(state.get('completed_sitemaps', []))
+                self.completed_shards = set(state.get('completed_shards', []))
+            except (OSError, json.JSONDecodeError):
+                print(f"Файл контрольной точки {path} повреждён, обход начнётся заново.")
+                self.exists = False
+
+    def mark_page(self, page_num, urls):
+        self.completed_pages.add(page_num)
+        self.seen_urls.update(urls)
+        self.save()
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'completed_pages': sorted(self.completed_pages),
+                'seen_urls': sorted(self.seen_urls),
+                'completed_sitemaps': sorted(self.completed_sitemaps),
+                'completed_shards': sorted(self.completed_shards),
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class JsonlWriter:
+    """Дописывает книги в JSONL-файл по одной, сразу сбрасывая их на диск. Файл открывается при
+    первой записи: обход, не собравший ни одной книги, не затирает JSONL прошлого обхода"""
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.mode = 'a' if append else 'w'
+        self.file = None
+
+    def write(self, book):
+        if self.file is None:
+            self.file = open(self.path, self.mode, encoding='utf-8')
+        self.file.write(json.dumps(book, ensure_ascii=False) + '\n')
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_jsonl(path):
+    """Книги из JSONL-файла по одной. Недописанная последняя строка пропускается"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def compact_jsonl(jsonl_path, json_path):
+    """Переписывает JSONL в обычный JSON-массив, не загружая все книги в память"""
+    count = 0
+    with open(json_path, 'w', encoding='utf-8') as out_file:
+        out_file.write('[')
+        for book in read_jsonl(jsonl_path):
+            out_file.write(',\n' if count else '\n')
+            out_file.write(json.dumps(book, ensure_ascii=False, indent=2))
+            count += 1
+        out_file.write('\n]' if count else ']')
+    return count
+
+
+def crawl_to_jsonl(parser, jsonl_path, checkpoint_path, max_pages=18, on_book=None):
+    """Обход каталога с записью каждой книги в JSONL и возобновлением после сбоя.
+
+    Если файл контрольной точки существует, уже обработанные страницы и ссылки пропускаются,
+    а новые книги дописываются в конец jsonl_path. После полного обхода контрольная точка удаляется.
+    Если страница каталога или книги не загрузилась, контрольная точка остаётся: такие страницы
+    не считаются готовыми и загружаются при следующем запуске.
+    on_book вызывается для каждой записанной книги (например, для подсчёта прогресса).
+    Возвращает число записанных книг и признак полного обхода: собирать JSON можно только после него."""
+    checkpoint = CrawlCheckpoint(checkpoint_path)
+    if checkpoint.exists and os.path.exists(jsonl_path):
+        # Книги, записанные после последнего сохранения контрольной точки, тоже считаются собранными
+        checkpoint.seen_urls.update(book.get('url') for book in read_jsonl(jsonl_path))
+        print(f"Продолжение обхода: готово страниц {len(checkpoint.completed_pages)}, "
+              f"книг {len(checkpoint.seen_urls)}")
+
+    count = 0
+    finished = False
+    try:
+        with JsonlWriter(jsonl_path, append=checkpoint.exists) as writer:
+            count, finished = _crawl_pages(parser, checkpoint, writer, max_pages, on_book)
+    finally:
+        finish_checkpoint(checkpoint, finished, count)
+    return count, finished
+
+
+def finish_checkpoint(checkpoint, finished, count):
+    """После полного обхода контрольная точка удаляется. После прерванного сохраняется, если обход
+    что-то записал или уже продолжался. Если новый обход не собрал ни одной книги, JSONL прошлого
+    обхода не тронут (JsonlWriter не открывал файл), и следующий запуск начнёт заново"""
+    if finished:
+        checkpoint.remove()
+    elif count or os.path.exists(checkpoint.path):
+        checkpoint.save()
+
+
+def _crawl_pages(parser, checkpoint, writer, max_pages, on_book):
+    """Обходит страницы каталога; возвращает число записанных книг и признак полного обхода"""
+    count = 0
+    finished = True
+    for page_num in range(1, max_pages + 1):
+        if page_num in checkpoint.completed_pages:
+            continue
+        try:
+            cards = parser.parse_catalog_cards(page_num)
+            if cards is None:
+                print(f"Страница каталога {page_num} не загрузилась, обход можно продолжить позже")
+                finished = False
+                break
+            if not cards:
+                # Каталог закончился
+                break
+
+            new_cards = [card for card in cards if card['url'] not in checkpoint.seen_urls]
+            urls = []
+            failed = 0
+            for book in parser.fetch_details(new_cards):
+                if book['url'] in parser.failed_urls:
+                    # Пустую запись не сохраняем, книга загрузится при следующем запуске
+                    failed += 1
+                    continue
+                if book.get('isbn'):
+                    book['isbn_clean'] = parser.clean_isbn(book['isbn'])
+                writer.write(book)
+                if on_book:
+                    on_book(book)
+                urls.append(book['url'])
+                count += 1
+        except Exception:
+            parser.profiler.count('errors.crawl')
+            finished = False
+            break
+        if failed:
+            finished = False
+            checkpoint.seen_urls.update(urls)
+            checkpoint.save()
+        else:
+            checkpoint.mark_page(page_num, urls)
+    return count, finished
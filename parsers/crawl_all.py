@@ -0,0 +1,151 @@
+"""Одновременный обход всех трёх магазинов.
+
+Все парсеры работают через один CrawlEngine: у каждого сайта свой пул потоков размером с его
+лимит параллельных запросов и своя частота, поэтому магазины не ждут друг друга. На выходе те же books_*.json,
+что читает merge_data.py. Запуск: python crawl_all.py [--budget labirint=4] [--sitemap]
+"""
+import argparse
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from checkpoint import compact_jsonl, crawl_to_jsonl
+from crawl_engine import CrawlEngine
+from crawl_stats import dump_profiles
+from parsing import ChitaiGorodParser
+from parsing_bookvoed import BookvoedParser
+from parsing_labirint import LabirintParser
+from replay import record
+from sitemap import crawl_sitemap_to_jsonl
+
+# Магазин: (класс парсера, имя выходных файлов без расширения)
+SHOPS = {
+    'chitai-gorod': (ChitaiGorodParser, 'books_vladivostok'),
+    'labirint': (LabirintParser, 'books_labirint'),
+    'bookvoed': (BookvoedParser, 'books_bookvoed'),
+}
+
+
+class CrawlProgress:
+    """Общий счётчик собранных книг по магазинам"""
+
+    def __init__(self, shops):
+        self.counts = {shop: 0 for shop in shops}
+        self.finished = set()
+        self.lock = threading.Lock()
+
+    def add(self, shop):
+        with self.lock:
+            self.counts[shop] += 1
+
+    def done(self, shop):
+        with self.lock:
+            self.finished.add(shop)
+
+    def report(self):
+        with self.lock:
+            parts = [f"{shop}: {count}{' (готово)' if shop in self.finished else ''}"
+                     for shop, count in self.counts.items()]
+            total = sum(self.counts.values())
+        return f"{' | '.join(parts)} | всего {total}"
+
+
+def parse_budgets(values, default):
+    budgets = {shop: default for shop in SHOPS}
+    for value in values or []:
+        shop, _, limit = value.partition('=')
+        if shop not in SHOPS or not limit.isdigit():
+            raise SystemExit(f"Неверный бюджет: {value}. Ожидается магазин=число, магазины: {', '.join(SHOPS)}")
+        budgets[shop] = int(limit)
+    return budgets
+
+
+def crawl_shop(shop, parser, args, progress):
+    base = SHOPS[shop][1]
+    checkpoint_path = f'{base}.sitemap.checkpoint.json' if args.sitemap else f'{base}.checkpoint.json'
+
+    def on_book(book):
+        progress.add(shop)
+
+    try:
+        if args.sitemap:
+            _, finished = crawl_sitemap_to_jsonl(parser, parser.SITEMAP_URL, f'{base}.jsonl', checkpoint_path,
+                                                 args.shard_size, on_book=on_book)
+        else:
+            _, finished = crawl_to_jsonl(parser, f'{base}.jsonl', checkpoint_path, max_pages=args.max_pages,
+                                         on_book=on_book)
+
+        if not finished and os.path.exists(checkpoint_path):
+            print(f"{shop}: обход прерван, повторный запуск продолжит его с места остановки.")
+        elif not finished:
+            print(f"{shop}: не удалось собрать данные о книгах, прежние файлы не изменены.")
+        else:
+            total = compact_jsonl(f'{base}.jsonl', f'{base}.json')
+            print(f"{shop}: всего собрано книг: {total}")
+    finally:
+        if parser.pipeline:
+            parser.pipeline.shutdown()
+        progress.done(shop)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--concurrency', type=int, default=6, help='параллельных запросов к каждому сайту')
+    arg_parser.add_argument('--budget', action='append', metavar='МАГАЗИН=N',
+                            help='свой лимит параллельных запросов для магазина, например labirint=4')
+    arg_parser.add_argument('--rate', type=float, default=8.0, help='запросов в секунду к каждому сайту')
+    arg_parser.add_argument('--max-pages', type=int, default=18, help='страниц каталога на магазин')
+    arg_parser.add_argument('--sitemap', action='store_true', help='обходить магазины по sitemap')
+    arg_parser.add_argument('--shard-size', type=int, default=200, help='ссылок из sitemap в одной порции')
+    arg_parser.add_argument('--processes', type=int, default=0,
+                            help='процессов для разбора детальных страниц в каждом магазине')
+    arg_parser.add_argument('--no-cache', action='store_true', help='не использовать дисковый кэш страниц')
+    arg_parser.add_argument('--record', metavar='КАТАЛОГ',
+                            help='сохранять загруженные страницы в КАТАЛОГ/<магазин> для bench_parsers.py')
+    arg_parser.add_argument('--profile', metavar='ФАЙЛ', help='сохранить замеры обхода всех магазинов в JSON')
+    arg_parser.add_argument('--report-every', type=float, default=10.0, help='период вывода прогресса, секунд')
+    args = arg_parser.parse_args()
+
+    budgets = parse_budgets(args.budget, args.concurrency)
+    host_limits = {
+        urlparse(parser_cls.SITEMAP_URL).netloc: {'per_host': budgets[shop], 'rate': args.rate}
+        for shop, (parser_cls, _) in SHOPS.items()
+    }
+    # Детальные страницы каждого сайта загружаются в его собственном пуле размером с бюджет
+    # (CrawlEngine.map(host=...)): сайт, выбравший бюджет, не занимает потоки других сайтов
+    engine = CrawlEngine(max_workers=args.concurrency, rate=args.rate, host_limits=host_limits)
+
+    progress = CrawlProgress(SHOPS)
+    threads = []
+    parsers = []
+    start = time.monotonic()
+    for shop, (parser_cls, _) in SHOPS.items():
+        parser = parser_cls(
+            engine=engine,
+            cache_dir=None if args.no_cache else '.http_cache',
+            extract_processes=args.processes,
+        )
+        if args.record:
+            record(parser, os.path.join(args.record, shop))
+        parsers.append(parser)
+        thread = threading.Thread(target=crawl_shop, args=(shop, parser, args, progress), name=shop)
+        thread.start()
+        threads.append(thread)
+
+    alive = threads
+    while alive:
+        alive[0].join(timeout=args.report_every)
+        alive = [thread for thread in threads if thread.is_alive()]
+        print(f"[{time.monotonic() - start:.0f} с] {progress.report()}")
+
+    engine.shutdown()
+    print(f"Обход завершён за {time.monotonic() - start:.0f} с. {progress.report()}")
+    for parser in parsers:
+        print(parser.profiler.report())
+    if args.profile:
+        dump_profiles([parser.profiler for parser in parsers], args.profile)
+
+
+if __name__ == "__main__":
+    main()
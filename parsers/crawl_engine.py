@@ -0,0 +1,93 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+
+def is_transient_error(error):
+    """Ошибка, после которой запрос стоит повторить позже: сеть, таймаут, 429 или 5xx.
+    Например, 404 повторять бесполезно"""
+    response = getattr(error, 'response', None)
+    return response is None or response.status_code == 429 or response.status_code >= 500
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов: rate токенов в секунду, не больше capacity подряд"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Забирает один токен, при необходимости ждёт. Возвращает время ожидания в секундах"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class CrawlEngine:
+    """Общий движок обхода: пул потоков, лимит параллельных запросов и частоты на каждый хост.
+
+    map(..., host=...) выполняет задачи в собственном пуле хоста размером с его лимит. В общем пуле
+    задачи хоста, выбравшего лимит, ждали бы семафор, занимая потоки, и задачи других хостов
+    стояли бы за ними в очереди"""
+
+    def __init__(self, max_workers=8, per_host=4, rate=4.0, burst=None, host_limits=None):
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.rate = rate
+        self.burst = burst
+        # Индивидуальные лимиты хостов: {'www.labirint.ru': {'per_host': 2, 'rate': 2.0}}
+        self.host_limits = host_limits or {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.semaphores = {}
+        self.buckets = {}
+        self.host_executors = {}
+        self.lock = threading.Lock()
+
+    def _host_state(self, host):
+        with self.lock:
+            if host not in self.semaphores:
+                limits = self.host_limits.get(host, {})
+                self.semaphores[host] = threading.BoundedSemaphore(limits.get('per_host', self.per_host))
+                self.buckets[host] = TokenBucket(limits.get('rate', self.rate), limits.get('burst', self.burst))
+            return self.semaphores[host], self.buckets[host]
+
+    @contextmanager
+    def throttle(self, url):
+        """Занимает слот хоста и токен частоты на время одного запроса"""
+        semaphore, bucket = self._host_state(urlparse(url).netloc)
+        with semaphore:
+            bucket.acquire()
+            yield
+
+    def _host_executor(self, host):
+        with self.lock:
+            if host not in self.host_executors:
+                limit = self.host_limits.get(host, {}).get('per_host', self.per_host)
+                self.host_executors[host] = ThreadPoolExecutor(max_workers=limit, thread_name_prefix=host)
+            return self.host_executors[host]
+
+    def map(self, func, items, host=None):
+        """Параллельно применяет func к items, результаты в исходном порядке. host — хост всех
+        запросов func: задачи идут в его пул, не мешая другим хостам"""
+        executor = self._host_executor(host) if host else self.executor
+        return list(executor.map(func, items))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        for executor in self.host_executors.values():
+            executor.shutdown(wait=True)
@@ -0,0 +1,90 @@
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Этапы обработки страницы в порядке вывода в отчёте
+STAGES = ('throttle', 'network', 'parse', 'extract')
+
+
+def percentile(values, q):
+    """Перцентиль методом ближайшего ранга, values должны быть отсортированы"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, math.ceil(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+class CrawlProfiler:
+    """Замеры обхода: время по этапам (ожидание лимита, сеть, построение дерева, извлечение),
+    скачанные байты и счётчики событий и ошибок"""
+
+    def __init__(self, name=''):
+        self.name = name
+        self.timings = defaultdict(list)
+        self.counters = defaultdict(int)
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def add_time(self, stage, seconds):
+        with self.lock:
+            self.timings[stage].append(seconds)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def merge_counters(self, counters):
+        with self.lock:
+            for name, value in counters.items():
+                self.counters[name] += value
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def summary(self):
+        with self.lock:
+            timings = {stage: sorted(values) for stage, values in self.timings.items()}
+            counters = dict(self.counters)
+
+        stages = {}
+        for stage in sorted(timings, key=lambda s: (STAGES.index(s) if s in STAGES else len(STAGES), s)):
+            values = timings[stage]
+            stages[stage] = {
+                'count': len(values),
+                'total_s': sum(values),
+                'p50_ms': percentile(values, 50) * 1000,
+                'p90_ms': percentile(values, 90) * 1000,
+                'p99_ms': percentile(values, 99) * 1000,
+                'max_ms': values[-1] * 1000,
+            }
+        return {
+            'name': self.name,
+            'wall_s': time.monotonic() - self.started,
+            'stages': stages,
+            'counters': counters,
+        }
+
+    def report(self):
+        summary = self.summary()
+        lines = [f"Профиль обхода {self.name} ({summary['wall_s']:.1f} с):",
+                 f"  {'этап':<10}{'кол-во':>8}{'всего, с':>10}{'p50, мс':>10}{'p90, мс':>10}{'p99, мс':>10}{'max, мс':>10}"]
+        for stage, stats in summary['stages'].items():
+            lines.append(f"  {stage:<10}{stats['count']:>8}{stats['total_s']:>10.1f}{stats['p50_ms']:>10.1f}"
+                         f"{stats['p90_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}")
+        for name, value in sorted(summary['counters'].items()):
+            lines.append(f"  {name}: {value}")
+        return '\n'.join(lines)
+
+
+def dump_profiles(profilers, path):
+    """Сохраняет сводки нескольких профилей в JSON-файл"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump([profiler.summary() for profiler in profilers], f, ensure_ascii=False, indent=2)
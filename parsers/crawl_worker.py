@@ -0,0 +1,147 @@
+"""Распределённый обход через общую очередь ссылок (job_queue.py).
+
+    python crawl_worker.py enqueue --shop labirint [--sitemap [URL]] [--max-pages 18]
+    python crawl_worker.py work [--shop labirint] [--worker-id host-1] [--rate 2] [--concurrency 2]
+    python crawl_worker.py stats
+    python crawl_worker.py export
+
+По умолчанию очередь — файл SQLite, и обработчиков (work) можно запустить сколько угодно, но на одной
+машине: очередь работает в режиме WAL, которому нужна общая память процессов, а блокировки SQLite на
+сетевых дисках (NFS, SMB) ненадёжны. Для обработчиков на разных машинах очередь кладётся в MySQL:
+--queue mysql://пользователь:пароль@хост/books_db у всех команд.
+Лимиты --rate и --concurrency действуют на каждый обработчик отдельно, поэтому нагрузка на сайт
+равна числу обработчиков × --rate. export сохраняет собранные книги в books_*.json для merge_data.py;
+файлы магазинов, по которым в очереди нет готовых книг, не трогаются.
+"""
+import argparse
+import os
+import socket
+import time
+
+from checkpoint import JsonlWriter, compact_jsonl
+from crawl_all import SHOPS
+from crawl_engine import CrawlEngine
+from job_queue import open_queue
+from sitemap import iter_product_urls, shard
+
+
+def make_parser(shop, args, engine=None):
+    parser_cls = SHOPS[shop][0]
+    engine = engine or CrawlEngine(max_workers=args.concurrency, per_host=args.concurrency, rate=args.rate)
+    return parser_cls(engine=engine, cache_dir=None if args.no_cache else '.http_cache')
+
+
+def enqueue(queue, args):
+    parser = make_parser(args.shop, args)
+    added = 0
+    if args.sitemap is not None:
+        urls = iter_product_urls(args.sitemap or parser.SITEMAP_URL, parser.PRODUCT_URL_RE, parser.session)
+        for batch in shard(urls, 1000):
+            added += queue.enqueue(args.shop, batch)
+    else:
+        for page_num in range(1, args.max_pages + 1):
+            cards = parser.parse_catalog_cards(page_num)
+            if cards is None:
+                # Повторный enqueue не добавит уже известные ссылки, поэтому его можно просто запустить снова
+                print(f"Страница каталога {page_num} не загрузилась, enqueue остановлен")
+                break
+            if not cards:
+                break
+            added += queue.enqueue(args.shop, [card['url'] for card in cards])
+    parser.engine.shutdown()
+    print(f"Добавлено новых ссылок: {added}")
+
+
+def work(queue, args):
+    worker_id = args.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    parsers = {}
+    # Один движок на обработчик: лимиты сайта не умножаются на число магазинов в аренде
+    engine = CrawlEngine(max_workers=args.concurrency, per_host=args.concurrency, rate=args.rate)
+    done = failed = 0
+
+    while True:
+        jobs = queue.lease(worker_id, shop=args.shop, limit=args.batch)
+        if not jobs:
+            if not queue.has_work(args.shop):
+                break
+            # Оставшиеся ссылки арендованы другими обработчиками; ждём, не истечёт ли аренда
+            time.sleep(args.idle_sleep)
+            continue
+
+        for shop in {job_shop for _, job_shop in jobs}:
+            if shop not in parsers:
+                parsers[shop] = make_parser(shop, args, engine)
+            parser = parsers[shop]
+            urls = [url for url, job_shop in jobs if job_shop == shop]
+
+            for url, book in zip(urls, parser.map_products(urls)):
+                # Пустое название означает, что страницу загрузить или разобрать не удалось
+                if not book.get('title'):
+                    queue.fail(worker_id, url, 'страница не загружена или не разобрана')
+                    failed += 1
+                    continue
+                if book.get('isbn'):
+                    book['isbn_clean'] = parser.clean_isbn(book['isbn'])
+                queue.ack(worker_id, url, book)
+                done += 1
+
+        print(f"{worker_id}: обработано {done}, ошибок {failed}")
+
+    engine.shutdown()
+
+
+def export(queue, args):
+    stats = queue.stats()
+    for shop, (_, base) in SHOPS.items():
+        if not stats.get(shop, {}).get('done'):
+            # Пустой экспорт затёр бы books_*.json прошлого обхода
+            print(f"{shop}: готовых книг в очереди нет, файлы не изменены")
+            continue
+        with JsonlWriter(f'{base}.jsonl') as writer:
+            for book in queue.results(shop):
+                writer.write(book)
+        total = compact_jsonl(f'{base}.jsonl', f'{base}.json')
+        print(f"{shop}: сохранено книг: {total}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('command', choices=['enqueue', 'work', 'stats', 'export'])
+    arg_parser.add_argument('--queue', default='crawl_queue.db',
+                            help='файл очереди SQLite или mysql://пользователь:пароль@хост/база')
+    arg_parser.add_argument('--shop', choices=list(SHOPS), help='магазин (для enqueue обязателен)')
+    arg_parser.add_argument('--sitemap', nargs='?', const='', help='брать ссылки из sitemap (URL или файл)')
+    arg_parser.add_argument('--max-pages', type=int, default=18, help='страниц каталога для enqueue')
+    arg_parser.add_argument('--worker-id', help='имя обработчика, по умолчанию хост-pid')
+    arg_parser.add_argument('--batch', type=int, default=20, help='ссылок в одной аренде')
+    arg_parser.add_argument('--lease', type=float, default=300, help='срок аренды, секунд')
+    arg_parser.add_argument('--max-attempts', type=int, default=3, help='попыток на одну ссылку')
+    arg_parser.add_argument('--idle-sleep', type=float, default=5.0,
+                            help='пауза, когда все ссылки разобраны другими обработчиками')
+    arg_parser.add_argument('--no-cache', action='store_true', help='не использовать дисковый кэш страниц')
+    arg_parser.add_argument('--rate', type=float, default=2.0,
+                            help='запросов в секунду к каждому сайту от одного обработчика')
+    arg_parser.add_argument('--concurrency', type=int, default=2,
+                            help='параллельных запросов к каждому сайту от одного обработчика')
+    args = arg_parser.parse_args()
+
+    if args.command == 'enqueue' and not args.shop:
+        arg_parser.error('для enqueue нужно указать --shop')
+
+    queue = open_queue(args.queue, lease_seconds=args.lease, max_attempts=args.max_attempts)
+    try:
+        if args.command == 'enqueue':
+            enqueue(queue, args)
+        elif args.command == 'work':
+            work(queue, args)
+        elif args.command == 'export':
+            export(queue, args)
+        else:
+            for shop, counts in queue.stats().items():
+                print(f"{shop}: " + ', '.join(f"{status} {count}" for status, count in counts.items()))
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Параллельный поиск дублей книг перед записью в БД.
+
+Книги с общим ISBN (у книги их может быть несколько) объединяются сразу. Для остальных в пуле процессов считаются подписи
+MinHash (fuzzy_match.py), и книги раскладываются по корзинам LSH. Корзины с несколькими книгами
+делятся на разделы по ключу корзины, каждый раздел сравнивается попарно в своём процессе.
+Найденные пары объединяются в кластеры системой непересекающихся множеств, корень кластера —
+книга с наименьшим номером. Пары не зависят от того, как корзины поделены между процессами,
+поэтому результат одинаков при любом числе процессов.
+"""
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from fuzzy_match import FuzzyIndex
+
+PARTITIONS = 64
+CHUNK_SIZE = 2000
+
+# Индекс с настройками сравнения и записи книг внутри процесса-обработчика
+_worker_index = None
+_worker_records = None
+
+
+def _init_worker(threshold, author_threshold, records=None):
+    global _worker_index, _worker_records
+    _worker_index = FuzzyIndex(threshold=threshold, author_threshold=author_threshold)
+    _worker_records = records
+
+
+def _make_records(chunk):
+    """Записи для сравнения и ключи полос LSH для части книг"""
+    result = []
+    for index, norm_title, norm_author in chunk:
+        record = _worker_index.make_record(norm_title, norm_author)
+        result.append((index, record, _worker_index.band_keys(record[0])))
+    return result
+
+
+def _resolve_partition(buckets):
+    """Пары дублей внутри раздела; buckets — списки номеров книг из одной корзины LSH"""
+    edges = set()
+    for bucket in buckets:
+        # Одинаковые название и автор объединяются сразу, попарно сравниваются только разные книги,
+        # и только внутри групп с одинаковыми номерами томов и частей, иначе совпадения быть не может
+        first_by_name = {}
+        distinct = defaultdict(list)
+        for index in bucket:
+            record, name = _worker_records[index]
+            first = first_by_name.get(name)
+            if first is None:
+                first_by_name[name] = index
+                distinct[record[2]].append((index, record))
+            else:
+                edges.add((first, index))
+        for group in distinct.values():
+            for position, (index, record) in enumerate(group):
+                for other, other_record in group[position + 1:]:
+                    if _worker_index.score(record, other_record) is not None:
+                        edges.add((index, other))
+    return sorted(edges)
+
+
+class UnionFind:
+    """Непересекающиеся множества, корень множества — наименьший номер"""
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, item):
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            if a < b:
+                self.parent[b] = a
+            else:
+                self.parent[a] = b
+
+
+def _run(executor, func, items):
+    if executor is None:
+        return map(func, items)
+    return executor.map(func, items)
+
+
+def find_clusters(records, processes=None, threshold=0.75, author_threshold=0.5, partitions=PARTITIONS):
+    """records — список (нормализованное название, нормализованный автор, список ISBN). Возвращает для каждой
+    книги номер первой книги её кластера. processes=1 считает всё в текущем процессе"""
+    clusters = UnionFind(len(records))
+
+    first_by_isbn = {}
+    for index, (_, _, isbns) in enumerate(records):
+        for isbn in isbns:
+            clusters.union(first_by_isbn.setdefault(isbn, index), index)
+
+    fuzzy_items = [(index, title, author) for index, (title, author, _) in enumerate(records) if title and author]
+    chunks = [fuzzy_items[start:start + CHUNK_SIZE] for start in range(0, len(fuzzy_items), CHUNK_SIZE)]
+
+    inline = processes == 1
+    if inline:
+        _init_worker(threshold, author_threshold)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                       initargs=(threshold, author_threshold))
+    compare = {}
+    buckets = defaultdict(list)
+    try:
+        for chunk_result in _run(executor, _make_records, chunks):
+            for index, record, band_keys in chunk_result:
+                compare[index] = (record, records[index][:2])
+                for band_key in band_keys:
+                    buckets[band_key].append(index)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # Корзины из одной книги сравнивать не с чем, остальные делятся на разделы по ключу корзины
+    parts = [[] for _ in range(partitions)]
+    for band_key, bucket in buckets.items():
+        if len(bucket) > 1:
+            parts[band_key % partitions].append(bucket)
+    parts = [part for part in parts if part]
+
+    if inline:
+        _init_worker(threshold, author_threshold, compare)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                       initargs=(threshold, author_threshold, compare))
+    try:
+        for edges in _run(executor, _resolve_partition, parts):
+            for a, b in edges:
+                clusters.union(a, b)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return [clusters.find(index) for index in range(len(records))]
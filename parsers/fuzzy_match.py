@@ -0,0 +1,197 @@
+"""Поиск похожих книг по названию и автору: MinHash по символьным триграммам и LSH.
+
+Для каждого названия считается подпись MinHash (num_perm минимумов хешей триграмм). Подпись
+режется на bands полос; книги, у которых совпала хотя бы одна полоса, становятся кандидатами.
+Кандидаты оцениваются по доле совпавших позиций подписи (оценка сходства Жаккара названий),
+сходству авторов без учёта порядка слов и совпадению номеров в названии (том, часть, класс).
+Триграммы одинаковы у названий, которые различаются одним словом («ЕГЭ» и «ОГЭ», «Звезда
+черного дракона» и «Наследница черного дракона»), поэтому совпадение принимается, только если
+слова одного названия входят в другое.
+Если установлен numpy, подписи и их сходство с кандидатами считаются векторно; результат от этого не меняется.
+"""
+import hashlib
+import operator
+import random
+import re
+from array import array
+from collections import defaultdict
+from functools import lru_cache
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+BRACKETS_RE = re.compile(r'\([^)]*\)')
+PUNCT_RE = re.compile(r'[^\w\s]')
+SPACES_RE = re.compile(r'\s+')
+# Номера томов и частей: цифры, римские числа и порядковые слова
+NUMBER_RE = re.compile(r'\b(?:\d+|[ivx]+|перв\w+|втор\w+|трет\w+|четв[её]рт\w+|пят\w+)\b')
+
+MASK64 = (1 << 64) - 1
+
+
+@lru_cache(maxsize=65536)
+def normalize_for_comparison(text):
+    if not text:
+        return ''
+
+    text = text.lower().strip()
+    text = BRACKETS_RE.sub('', text)
+    text = PUNCT_RE.sub(' ', text)
+    text = SPACES_RE.sub(' ', text)
+
+    return text.strip()
+
+
+def ngrams(text, n=3):
+    text = f" {text.replace('ё', 'е')} "
+    return {text[i:i + n] for i in range(max(1, len(text) - n + 1))}
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+@lru_cache(maxsize=65536)
+def author_ngrams(norm_author):
+    # «Фудзимото Тацуки» и «Тацуки Фудзимото» — один автор
+    return frozenset(ngrams(' '.join(sorted(norm_author.split()))))
+
+
+@lru_cache(maxsize=65536)
+def title_words(norm_title):
+    return frozenset(norm_title.replace('ё', 'е').split())
+
+
+def words_contained(words, cand_words):
+    """Все слова одного названия есть в другом: «мастер и маргарита» и «мастер и маргарита роман»"""
+    return words <= cand_words or cand_words <= words
+
+
+@lru_cache(maxsize=65536)
+def title_numbers(norm_title):
+    # По порядку, а не множеством: «1 класс, часть 2» и «2 класс, часть 1» — разные книги
+    return tuple(NUMBER_RE.findall(norm_title.replace('ё', 'е')))
+
+
+class MinHasher:
+    """Подпись MinHash: для каждой перестановки минимум старших 32 бит (a * h + b) mod 2^64
+    по 64-битным хешам триграмм h"""
+
+    def __init__(self, num_perm=64, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.a = [rng.getrandbits(64) | 1 for _ in range(num_perm)]
+        self.b = [rng.getrandbits(64) for _ in range(num_perm)]
+        self.gram_hashes = {}
+        if numpy is not None:
+            self.np_a = numpy.array(self.a, dtype=numpy.uint64).reshape(-1, 1)
+            self.np_b = numpy.array(self.b, dtype=numpy.uint64).reshape(-1, 1)
+
+    def gram_hash(self, gram):
+        value = self.gram_hashes.get(gram)
+        if value is None:
+            # hashlib, а не hash(): подписи не должны зависеть от PYTHONHASHSEED и процесса
+            value = int.from_bytes(hashlib.blake2b(gram.encode('utf-8'), digest_size=8).digest(), 'little')
+            self.gram_hashes[gram] = value
+        return value
+
+    def signature(self, grams):
+        hashes = [self.gram_hash(gram) for gram in grams]
+        if numpy is not None:
+            values = numpy.array(hashes, dtype=numpy.uint64)
+            # Умножение uint64 переполняется по модулю 2^64, как и маска в ветке без numpy
+            mins = (self.np_a * values + self.np_b).min(axis=1) >> numpy.uint64(32)
+            return array('I', mins.astype(numpy.uint32).tobytes())
+        return array('I', (min(((a * h + b) & MASK64) for h in hashes) >> 32
+                           for a, b in zip(self.a, self.b)))
+
+
+def estimate_similarity(sig_a, sig_b):
+    """Доля совпавших позиций подписей — оценка сходства Жаккара"""
+    return sum(map(operator.eq, sig_a, sig_b)) / len(sig_a)
+
+
+def estimate_similarities(signature, cand_signatures):
+    """estimate_similarity() подписи с каждой из подписей кандидатов. С numpy все кандидаты
+    сравниваются одной операцией: для одной пары вызов numpy дороже цикла по 64 позициям"""
+    if numpy is None or len(cand_signatures) < 2:
+        return [estimate_similarity(signature, cand_signature) for cand_signature in cand_signatures]
+    # Подписи array('I') склеиваются в матрицу кандидатов без разбора на числа
+    matrix = numpy.frombuffer(b''.join(cand_signatures), dtype=numpy.uint32).reshape(len(cand_signatures), -1)
+    return (matrix == numpy.frombuffer(signature, dtype=numpy.uint32)).mean(axis=1).tolist()
+
+
+class FuzzyIndex:
+    """Индекс книг для поиска похожих: add() добавляет книгу, best() находит самую похожую.
+
+    threshold — минимальное сходство названий, author_threshold — авторов. Названия и авторы
+    передаются уже нормализованными (normalize_for_comparison)."""
+
+    def __init__(self, threshold=0.75, author_threshold=0.5, num_perm=64, bands=16, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm должно делиться на bands")
+        self.threshold = threshold
+        self.author_threshold = author_threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm, seed)
+        self.buckets = defaultdict(list)
+        self.records = {}
+
+    def band_keys(self, signature):
+        rows = self.rows
+        return [hash((band,) + tuple(signature[band * rows:(band + 1) * rows])) for band in range(self.bands)]
+
+    def make_record(self, norm_title, norm_author):
+        """Всё, что нужно для сравнения книги: подпись названия, триграммы автора, номера и слова названия"""
+        return (self.hasher.signature(ngrams(norm_title)), author_ngrams(norm_author), title_numbers(norm_title),
+                title_words(norm_title))
+
+    def score(self, record, candidate, similarity=None):
+        """Сходство названий двух книг или None, если это точно разные книги. similarity —
+        уже посчитанная оценка сходства подписей"""
+        signature, authors, numbers, words = record
+        cand_signature, cand_authors, cand_numbers, cand_words = candidate
+        if cand_numbers != numbers:
+            return None
+        score = estimate_similarity(signature, cand_signature) if similarity is None else similarity
+        if score >= self.threshold and jaccard(authors, cand_authors) >= self.author_threshold and \
+                words_contained(words, cand_words):
+            return score
+        return None
+
+    def add(self, key, norm_title, norm_author):
+        record = self.make_record(norm_title, norm_author)
+        self.records[key] = record
+        for band_key in self.band_keys(record[0]):
+            self.buckets[band_key].append(key)
+
+    def candidates(self, signature):
+        found = set()
+        for band_key in self.band_keys(signature):
+            bucket = self.buckets.get(band_key)
+            if bucket:
+                found.update(bucket)
+        return found
+
+    def matches(self, norm_title, norm_author):
+        """Подходящие книги с оценкой сходства названий, от самой похожей"""
+        record = self.make_record(norm_title, norm_author)
+        keys = list(self.candidates(record[0]))
+        candidates = [self.records[key] for key in keys]
+        similarities = estimate_similarities(record[0], [candidate[0] for candidate in candidates])
+        found = []
+        for key, candidate, similarity in zip(keys, candidates, similarities):
+            score = self.score(record, candidate, similarity)
+            if score is not None:
+                found.append((key, score))
+        found.sort(key=lambda item: (-item[1], item[0]))
+        return found
+
+    def best(self, norm_title, norm_author):
+        found = self.matches(norm_title, norm_author)
+        return found[0][0] if found else None
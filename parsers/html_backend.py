@@ -0,0 +1,54 @@
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml  # noqa: F401
+    DEFAULT_BACKEND = 'lxml'
+except ImportError:
+    DEFAULT_BACKEND = 'html.parser'
+
+
+def available_backends():
+    backends = ['html.parser']
+    for name, module in (('lxml', 'lxml'), ('html5lib', 'html5lib')):
+        try:
+            __import__(module)
+            backends.append(name)
+        except ImportError:
+            pass
+    return backends
+
+
+def _attr_matches(actual, expected, attr):
+    if actual is None:
+        return False
+    if isinstance(actual, (list, tuple)):
+        actual = ' '.join(actual)
+    if callable(expected):
+        return bool(expected(actual))
+    if attr == 'class':
+        return expected in actual.split()
+    return actual == expected
+
+
+def scope(*rules):
+    """SoupStrainer, который строит дерево только для нужных узлов страницы.
+
+    Правило — пара (тег, {атрибут: значение}), тег None подходит к любому. Для class значение
+    ищется среди классов элемента, значением может быть и функция от строки атрибута.
+    Совпавший элемент попадает в дерево целиком, вместе со всеми вложенными тегами."""
+    def match(name, attrs):
+        if not isinstance(name, str):
+            return False
+        attrs = attrs or {}
+        for tag, expected_attrs in rules:
+            if tag is not None and tag != name:
+                continue
+            if all(_attr_matches(attrs.get(attr), value, attr) for attr, value in expected_attrs.items()):
+                return True
+        return False
+
+    return SoupStrainer(match)
+
+
+def make_soup(markup, parse_only=None, backend=None):
+    return BeautifulSoup(markup, backend or DEFAULT_BACKEND, parse_only=parse_only)
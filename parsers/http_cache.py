@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import time
+import zlib
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Время жизни закэшированных страниц по типам, в секундах
+PAGE_TTL = {
+    'catalog': 6 * 3600,
+    # Каталог при обновлении цен всегда перепроверяется на сервере
+    'prices': 0,
+    'detail': 7 * 24 * 3600,
+    # Страница книги при обходе по sitemap: с неё берутся и цены, поэтому живёт сутки
+    'product': 24 * 3600,
+}
+
+
+class CachedSession(requests.Session):
+    """requests.Session с дисковым кэшем ответов и условной перепроверкой (ETag / Last-Modified).
+    При cache_dir=None кэш отключён и сессия работает как обычная"""
+
+    def __init__(self, cache_dir='.http_cache'):
+        super().__init__()
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.cache_dir, key[:2], key)
+        return base + '.json', base + '.body'
+
+    def _load(self, url):
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = zlib.decompress(f.read())
+            return meta, body
+        except (OSError, ValueError, zlib.error):
+            return None, None
+
+    def _write(self, path, data, mode):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, mode, **({} if 'b' in mode else {'encoding': 'utf-8'})) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _store(self, url, meta, body=None):
+        meta_path, body_path = self._paths(url)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        if body is not None:
+            self._write(body_path, zlib.compress(body, 6), 'wb')
+        self._write(meta_path, json.dumps(meta, ensure_ascii=False), 'w')
+
+    def _from_cache(self, url, meta, body):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = body
+        response.headers = CaseInsensitiveDict(meta.get('headers', {}))
+        response.encoding = meta.get('encoding')
+        response.url = url
+        response.from_cache = True
+        return response
+
+    def get_fresh(self, url, params=None, ttl=None):
+        """Ответ из кэша, если он ещё не устарел, иначе None. В сеть не ходит"""
+        if ttl is None or not self.cache_dir:
+            return None
+        full_url = requests.Request('GET', url, params=params).prepare().url
+        meta, body = self._load(full_url)
+        if meta and time.time() - meta['stored_at'] < ttl:
+            return self._from_cache(full_url, meta, body)
+        return None
+
+    def get(self, url, params=None, ttl=None, **kwargs):
+        """GET с кэшем. ttl=None отключает кэш для запроса"""
+        if ttl is None or not self.cache_dir:
+            return super().get(url, params=params, **kwargs)
+
+        full_url = requests.Request('GET', url, params=params).prepare().url
+        meta, body = self._load(full_url)
+
+        if meta and time.time() - meta['stored_at'] < ttl:
+            return self._from_cache(full_url, meta, body)
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        if meta:
+            if meta['headers'].get('ETag'):
+                headers['If-None-Match'] = meta['headers']['ETag']
+            if meta['headers'].get('Last-Modified'):
+                headers['If-Modified-Since'] = meta['headers']['Last-Modified']
+
+        response = super().get(full_url, headers=headers, **kwargs)
+
+        if response.status_code == 304 and meta:
+            meta['stored_at'] = time.time()
+            self._store(full_url, meta)
+            return self._from_cache(full_url, meta, body)
+
+        if response.status_code == 200:
+            self._store(full_url, {
+                'url': full_url,
+                'stored_at': time.time(),
+                'encoding': response.encoding,
+                'headers': {
+                    name: response.headers[name]
+                    for name in ('Content-Type', 'ETag', 'Last-Modified')
+                    if name in response.headers
+                },
+            }, response.content)
+
+        response.from_cache = False
+        return response
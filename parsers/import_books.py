@@ -1,42 +1,420 @@
-import json
+import argparse
+import os
+import time
 import mysql.connector
 from mysql.connector import Error
 import re
 import getpass
 
+from dedup import find_clusters
+from fuzzy_match import FuzzyIndex, normalize_for_comparison
+from isbn import book_isbns, canonical_isbns
+from merge_data import iter_books
+from schema import bump_dataset_version, migrate, refresh_prices
 
-def get_isbn_clean(book):
-    isbn_clean = book.get('isbn_clean')
-    if isbn_clean:
-        return str(isbn_clean).strip()
+YEAR_RE = re.compile(r'\b(20\d{2}|19\d{2})\b')
 
-    isbn = book.get('isbn')
-    if isbn:
-        return ''.join(filter(str.isdigit, str(isbn)))[:20]
 
+def parse_year(year_str):
+    if year_str:
+        year_match = YEAR_RE.search(str(year_str))
+        if year_match:
+            return int(year_match.group(1))
     return None
 
 
-def normalize_for_comparison(text):
-    if not text:
-        return ''
+def parse_prices(book):
+    try:
+        price = float(book['price']) if book.get('price') else None
+        old_price = float(book['old_price']) if book.get('old_price') else None
+    except (ValueError, TypeError):
+        price = old_price = None
+    return price, old_price
+
+
+class ProductIndex:
+    """Товары в памяти для поиска совпадений без запросов к БД: по ISBN, по точной паре
+    (название, автор) и по похожим названиям и авторам (fuzzy_match.py)"""
+
+    def __init__(self, threshold=0.75):
+        self.by_isbn = {}
+        self.by_key = {}
+        self.fuzzy = FuzzyIndex(threshold=threshold)
+        self.size = 0
+
+    def add(self, product_id, isbns, title, author):
+        self.size += 1
+        self.add_isbns(product_id, isbns)
+
+        norm_title = normalize_for_comparison(title)
+        norm_author = normalize_for_comparison(author)
+        if not (norm_title and norm_author):
+            return
+        if (norm_title, norm_author) not in self.by_key:
+            self.by_key[(norm_title, norm_author)] = product_id
+            self.fuzzy.add(product_id, norm_title, norm_author)
+
+    def add_isbns(self, product_id, isbns):
+        for isbn in isbns:
+            self.by_isbn.setdefault(isbn, product_id)
+
+    def find(self, isbns, title, author):
+        for isbn in isbns:
+            if isbn in self.by_isbn:
+                return self.by_isbn[isbn]
+
+        if not (title and author):
+            return None
+        norm_title = normalize_for_comparison(title)
+        norm_author = normalize_for_comparison(author)
+        if not (norm_title and norm_author):
+            return None
+
+        product_id = self.by_key.get((norm_title, norm_author))
+        if product_id:
+            return product_id
+        return self.fuzzy.best(norm_title, norm_author)
+
+    @classmethod
+    def load(cls, conn, threshold=0.75):
+        """Загружает все товары из БД"""
+        index = cls(threshold)
+        for product_id, isbns, title, author in load_products(conn):
+            index.add(product_id, isbns, title, author)
+        return index
+
+
+def load_products(conn):
+    """Товары из БД: (id, все ISBN, название, автор)"""
+    cursor = conn.cursor()
+    isbns_by_product = {}
+    cursor.execute("SELECT isbn, product_id FROM product_isbns ORDER BY isbn")
+    for isbn, product_id in cursor:
+        isbns_by_product.setdefault(product_id, []).append(isbn)
+
+    cursor.execute("SELECT id, isbn_clean, canonical_name, author FROM products ORDER BY id")
+    for product_id, isbn_clean, title, author in cursor:
+        isbns = canonical_isbns(isbn_clean)
+        isbns += [isbn for isbn in isbns_by_product.get(product_id, ()) if isbn not in isbns]
+        yield product_id, isbns, title, author
+    cursor.close()
+
+
+def same_price(a, b):
+    # Из БД цена приходит Decimal, из файла — float
+    if a is None or b is None:
+        return a is None and b is None
+    return round(float(a), 2) == round(float(b), 2)
+
+
+class BulkImporter:
+    """Импорт книг пачками: строки копятся в памяти и пишутся многострочными INSERT через executemany,
+    транзакция фиксируется каждые commit_every книг.
+
+    id новых товаров выдаются самим импортёром начиная с MAX(id) + 1, чтобы предложения можно было
+    вставить той же пачкой, не дожидаясь lastrowid. Поэтому во время импорта в products больше
+    никто писать не должен.
 
-    text = text.lower().strip()
-    text = re.sub(r'\([^)]*\)', '', text)
-    text = re.sub(r'[^\w\s]', ' ', text)
-    text = re.sub(r'\s+', ' ', text)
+    Предложение определяется магазином и ссылкой: повторный импорт того же обхода ничего не
+    добавляет, а обновляет только предложения с изменившейся ценой или скидкой. Предложения
+    магазинов из этого импорта, которых в нём не оказалось, помечаются is_stale в finish().
+    Сводка цен (products.min_price и др.) пересчитывается при каждом commit() только у товаров,
+    чьи предложения изменились. Версия данных для кэша сайта увеличивается один раз, в последней
+    транзакции импорта (commit(final=True)): промежуточные фиксации не сбрасывают кэш сайта.
 
-    return text.strip()
+    При processes > 0 дубли ищутся заранее, параллельно (dedup.py): prepare_clusters() получает
+    все книги, и add_book() должен получить их же в том же порядке."""
 
+    def __init__(self, conn, batch_size=1000, commit_every=10000, threshold=0.75, processes=0):
+        self.conn = conn
+        self.cursor = conn.cursor(dictionary=True)
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.threshold = threshold
+        self.processes = processes
 
-def import_books():
+        # Недостающие таблицы, столбцы и индексы создаются до первого запроса к ним
+        migrate(conn)
+
+        self.cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 AS next_id FROM products")
+        self.next_product_id = self.cursor.fetchone()['next_id']
+
+        self.index = None
+        self.book_roots = None
+        if not processes:
+            self.index = ProductIndex.load(conn, threshold)
+            print(f"Загружено товаров для поиска совпадений: {self.index.size}")
+
+        self.load_offers()
+        self.cursor.execute("SELECT isbn FROM product_isbns")
+        self.known_isbns = {row['isbn'] for row in self.cursor.fetchall()}
+
+        self.pending_products = []
+        self.pending_isbns = []
+        self.pending_offers = []
+        self.pending_offer_updates = []
+        self.touched_products = set()
+        # Были ли записи в БД после последней фиксации и после последней смены версии данных:
+        # версия меняется, только если импорт что-то записал
+        self.dirty = False
+        self.changed = False
+        self.uncommitted = 0
+
+        self.stats = {
+            'total': 0,
+            'new_books': 0,
+            'duplicates': 0,
+            'offers': 0,
+            'offers_updated': 0,
+            'offers_unchanged': 0,
+            'offers_stale': 0,
+            'used_isbn_clean': 0,
+            'used_isbn_raw': 0,
+            'commits': 0
+        }
+        self.started = time.perf_counter()
+
+    def load_offers(self):
+        """Текущие предложения: (магазин, ссылка) -> данные для сравнения. Если после прежних импортов
+        у ссылки несколько строк, сравнивается последняя, остальные станут устаревшими"""
+        self.offers = {}
+        self.live_offers = {}
+        self.seen_offer_keys = set()
+        self.seen_offer_ids = set()
+        self.seen_sites = set()
+
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT id, website_name, url, product_id, price, old_price, discount, is_stale
+            FROM offers ORDER BY id
+        """)
+        for offer_id, website_name, url, product_id, price, old_price, discount, is_stale in cursor:
+            self.offers[(website_name, url)] = (offer_id, product_id, price, old_price, discount or '', is_stale)
+            if not is_stale:
+                self.live_offers[offer_id] = (website_name, product_id)
+        cursor.close()
+
+    def prepare_clusters(self, books):
+        """Кластеры дублей для всех книг сразу. Товары из БД идут в начале списка, поэтому корнем
+        кластера с уже известным товаром всегда оказывается этот товар"""
+        product_ids = []
+        records = []
+        for product_id, isbns, title, author in load_products(self.conn):
+            product_ids.append(product_id)
+            records.append((normalize_for_comparison(title), normalize_for_comparison(author), isbns))
+
+        for book in books:
+            records.append((normalize_for_comparison(book.get('title', '').strip()),
+                            normalize_for_comparison(book.get('author', '').strip()),
+                            book_isbns(book)))
+
+        start = time.perf_counter()
+        roots = find_clusters(records, processes=self.processes, threshold=self.threshold)
+        # Корень кластера -> id товара; новые товары добавляются по мере импорта
+        self.cluster_products = dict(enumerate(product_ids))
+        self.book_roots = iter(roots[len(product_ids):])
+        print(f"Поиск дублей: {len(records)} записей, {len(set(roots))} кластеров "
+              f"за {time.perf_counter() - start:.1f} с")
+
+    def add_book(self, book):
+        self.stats['total'] += 1
+
+        isbns = book_isbns(book)
+        # isbn_clean уникален: ISBN, уже записанный за другим товаром, в него не попадает
+        isbn_clean = isbns[0] if isbns and isbns[0] not in self.known_isbns else None
+        title = book.get('title', '').strip()
+        author = book.get('author', '').strip()
+
+        if book.get('isbn_clean'):
+            self.stats['used_isbn_clean'] += 1
+        elif book.get('isbn'):
+            self.stats['used_isbn_raw'] += 1
+
+        # Ссылка, уже известная по прежним импортам, остаётся за своим товаром
+        offer = self.offers.get((book.get('source', 'unknown'), book.get('url', ''))) if book.get('url') else None
+        if self.book_roots is not None:
+            root = next(self.book_roots)
+            product_id = self.cluster_products.get(root)
+            if not product_id and offer and offer[1]:
+                product_id = self.cluster_products[root] = offer[1]
+        elif offer and offer[1]:
+            product_id = offer[1]
+        else:
+            product_id = self.index.find(isbns, title, author)
+
+        if not product_id:
+            product_id = self.next_product_id
+            self.next_product_id += 1
+            self.pending_products.append((
+                product_id,
+                title,
+                author,
+                isbn_clean,
+                book.get('publisher', ''),
+                parse_year(book.get('year', '')),
+                book.get('genre', ''),
+                book.get('description', ''),
+                book.get('image_url', '')
+            ))
+            if self.book_roots is not None:
+                self.cluster_products[root] = product_id
+            else:
+                self.index.add(product_id, isbns, title, author)
+            self.stats['new_books'] += 1
+        else:
+            self.stats['duplicates'] += 1
+            if self.index is not None:
+                self.index.add_isbns(product_id, isbns)
+
+        # Все ISBN книги запоминаются за товаром, даже если он найден по названию
+        for isbn in isbns:
+            if isbn not in self.known_isbns:
+                self.known_isbns.add(isbn)
+                self.pending_isbns.append((isbn, product_id))
+
+        self.add_offer(book, product_id)
+        self.uncommitted += 1
+
+        if self.stats['total'] % self.batch_size == 0:
+            self.flush()
+            if self.uncommitted >= self.commit_every:
+                self.commit()
+
+    def add_offer(self, book, product_id):
+        website_name = book.get('source', 'unknown')
+        url = book.get('url', '')
+        price, old_price = parse_prices(book)
+        discount = book.get('discount', '')
+        self.seen_sites.add(website_name)
+
+        key = (website_name, url)
+        if url and key in self.seen_offer_keys:
+            return
+        self.seen_offer_keys.add(key)
+
+        existing = self.offers.get(key) if url else None
+        if existing is None:
+            self.pending_offers.append((
+                product_id,
+                website_name,
+                price,
+                old_price,
+                discount,
+                url,
+                book.get('city', 'Владивосток')
+            ))
+            self.touched_products.add(product_id)
+            self.stats['offers'] += 1
+            return
+
+        offer_id, old_product_id, old_price_db, old_old_price, old_discount, is_stale = existing
+        self.seen_offer_ids.add(offer_id)
+        if not is_stale and old_product_id == product_id and same_price(old_price_db, price) and \
+                same_price(old_old_price, old_price) and old_discount == (discount or ''):
+            self.stats['offers_unchanged'] += 1
+            return
+
+        self.pending_offer_updates.append((product_id, price, old_price, discount, offer_id))
+        # Предложение могло перейти к другому товару: сводку нужно пересчитать у обоих
+        self.touched_products.update((product_id, old_product_id))
+        self.stats['offers_updated'] += 1
+
+    def flush(self):
+        """Записывает накопленную пачку товаров и предложений"""
+        if self.pending_products or self.pending_isbns or self.pending_offers or self.pending_offer_updates:
+            self.dirty = True
+        if self.pending_products:
+            self.cursor.executemany("""
+                INSERT INTO products
+                (id, canonical_name, author, isbn_clean, publisher, year, genre, description, image_url)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, self.pending_products)
+        if self.pending_isbns:
+            self.cursor.executemany(
+                "INSERT IGNORE INTO product_isbns (isbn, product_id) VALUES (%s, %s)",
+                self.pending_isbns
+            )
+        if self.pending_offers:
+            self.cursor.executemany("""
+                INSERT INTO offers
+                (product_id, website_name, price, old_price, discount, url, city, is_stale, last_changed_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, 0, NOW())
+            """, self.pending_offers)
+        if self.pending_offer_updates:
+            self.cursor.executemany("""
+                UPDATE offers
+                SET product_id = %s, price = %s, old_price = %s, discount = %s, is_stale = 0, last_changed_at = NOW()
+                WHERE id = %s
+            """, self.pending_offer_updates)
+        self.pending_products = []
+        self.pending_isbns = []
+        self.pending_offers = []
+        self.pending_offer_updates = []
+
+    def finish(self):
+        """Помечает устаревшими предложения магазинов из этого импорта, которых в нём не было"""
+        stale = []
+        for offer_id, (website_name, product_id) in self.live_offers.items():
+            if website_name in self.seen_sites and offer_id not in self.seen_offer_ids:
+                stale.append(offer_id)
+                self.touched_products.add(product_id)
+        for start in range(0, len(stale), self.batch_size):
+            chunk = stale[start:start + self.batch_size]
+            self.cursor.execute(
+                f"UPDATE offers SET is_stale = 1 WHERE id IN ({', '.join(['%s'] * len(chunk))})",
+                chunk
+            )
+        self.stats['offers_stale'] = len(stale)
+        self.dirty = self.dirty or bool(stale)
+        self.commit(final=True)
+
+    def commit(self, final=False):
+        self.flush()
+        if self.touched_products:
+            refresh_prices(self.cursor, self.touched_products, self.batch_size)
+            self.touched_products = set()
+        self.changed = self.changed or self.dirty
+        self.dirty = False
+        if final and self.changed:
+            # Кэш сайта сбрасывается один раз, вместе с последней фиксацией импорта
+            bump_dataset_version(self.cursor)
+            self.changed = False
+        self.conn.commit()
+        self.uncommitted = 0
+        self.stats['commits'] += 1
+        elapsed = time.perf_counter() - self.started
+        print(f"Записано {self.stats['total']} книг, {self.stats['total'] / elapsed:.0f} строк/с")
+
+    def rollback(self):
+        self.pending_products = []
+        self.pending_isbns = []
+        self.pending_offers = []
+        self.pending_offer_updates = []
+        self.touched_products = set()
+        self.dirty = False
+        self.conn.rollback()
+
+    def close(self):
+        self.cursor.close()
+
+
+def find_input():
+    # merge_data.py пишет JSONL или двоичный *.books; берётся самый свежий из имеющихся файлов
+    candidates = [filename for filename in ('../data/all_books_raw.books', '../data/all_books_raw.jsonl',
+                                            '../data/all_books_raw.json') if os.path.exists(filename)]
+    if not candidates:
+        return None
+    return max(candidates, key=os.path.getmtime)
+
+
+def import_books(input_filename=None, batch_size=1000, commit_every=10000, threshold=0.75, processes=0):
     password = getpass.getpass("Введите пароль MySQL: ")
 
-    try:
-        with open('../data/all_books_raw.json', 'r', encoding='utf-8') as f:
-            books = json.load(f)
-    except FileNotFoundError:
+    input_filename = input_filename or find_input()
+    if not input_filename or not os.path.exists(input_filename):
+        print("Файл с книгами не найден, сначала запустите merge_data.py")
         return
+    books = iter_books(input_filename)
 
     try:
         conn = mysql.connector.connect(
@@ -46,124 +424,51 @@ def import_books():
             database='books_db',
             charset='utf8mb4'
         )
-        cursor = conn.cursor(dictionary=True)
-    except Error:
+    except Error as e:
+        print(f"Не удалось подключиться к MySQL: {e}")
         return
 
-    stats = {
-        'total': 0,
-        'new_books': 0,
-        'duplicates': 0,
-        'offers': 0,
-        'used_isbn_clean': 0,
-        'used_isbn_raw': 0
-    }
-
+    importer = BulkImporter(conn, batch_size=batch_size, commit_every=commit_every, threshold=threshold,
+                            processes=processes)
     try:
+        if processes:
+            # Первый проход по файлу — поиск дублей, второй — запись
+            importer.prepare_clusters(books)
+            books = iter_books(input_filename)
         for book in books:
-            stats['total'] += 1
-
-            isbn_clean = get_isbn_clean(book)
-            title = book.get('title', '').strip()
-            author = book.get('author', '').strip()
-
-            if book.get('isbn_clean'):
-                stats['used_isbn_clean'] += 1
-            elif book.get('isbn'):
-                stats['used_isbn_raw'] += 1
-
-            product_id = None
-
-            if isbn_clean:
-                cursor.execute(
-                    "SELECT id FROM products WHERE isbn_clean = %s",
-                    (isbn_clean,)
-                )
-                result = cursor.fetchone()
-                if result:
-                    product_id = result['id']
-
-            if not product_id and title and author:
-                norm_title = normalize_for_comparison(title)
-                norm_author = normalize_for_comparison(author)
-
-                if norm_title and norm_author:
-                    cursor.execute("""
-                        SELECT id, canonical_name, author 
-                        FROM products 
-                        WHERE 
-                            (LOWER(REPLACE(canonical_name, ' ', '')) LIKE CONCAT('%', REPLACE(%s, ' ', ''), '%')
-                            OR LOWER(canonical_name) LIKE CONCAT('%', %s, '%'))
-                        LIMIT 5
-                    """, (norm_title, norm_title))
-
-                    candidates = cursor.fetchall()
-
-                    for candidate in candidates:
-                        cand_title_norm = normalize_for_comparison(candidate['canonical_name'])
-                        cand_author_norm = normalize_for_comparison(candidate['author'])
-
-                        if (norm_title in cand_title_norm or cand_title_norm in norm_title) and \
-                                (norm_author in cand_author_norm or cand_author_norm in norm_author):
-                            product_id = candidate['id']
-                            break
-
-            if not product_id:
-                year_str = book.get('year', '')
-                year_int = None
-                if year_str:
-                    year_match = re.search(r'\b(20\d{2}|19\d{2})\b', str(year_str))
-                    if year_match:
-                        year_int = int(year_match.group(1))
-
-                cursor.execute("""
-                    INSERT INTO products 
-                    (canonical_name, author, isbn_clean, publisher, year, genre, description, image_url)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    title,
-                    author,
-                    isbn_clean,
-                    book.get('publisher', ''),
-                    year_int,
-                    book.get('genre', ''),
-                    book.get('description', ''),
-                    book.get('image_url', '')
-                ))
-                product_id = cursor.lastrowid
-                stats['new_books'] += 1
-            else:
-                stats['duplicates'] += 1
+            importer.add_book(book)
+        importer.finish()
 
+    except Error as e:
+        # Откатывается только незафиксированная часть, всё до последнего commit уже в БД
+        importer.rollback()
+        print(f"Ошибка MySQL: {e}. Последняя незафиксированная пачка отменена.")
+        if importer.changed:
+            # Зафиксированная часть уже в БД: сайт должен её увидеть
             try:
-                price = float(book['price']) if book.get('price') else None
-                old_price = float(book['old_price']) if book.get('old_price') else None
-            except (ValueError, TypeError):
-                price = old_price = None
-
-            cursor.execute("""
-                INSERT INTO offers 
-                (product_id, website_name, price, old_price, discount, url, city)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (
-                product_id,
-                book.get('source', 'unknown'),
-                price,
-                old_price,
-                book.get('discount', ''),
-                book.get('url', ''),
-                book.get('city', 'Владивосток')
-            ))
-            stats['offers'] += 1
-
-        conn.commit()
-
-    except Error:
-        conn.rollback()
+                importer.commit(final=True)
+            except Error as e:
+                print(f"Не удалось обновить версию данных: {e}")
     finally:
-        cursor.close()
+        importer.close()
         conn.close()
 
+    stats = importer.stats
+    elapsed = time.perf_counter() - importer.started
+    print(f"Импортировано книг: {stats['total']} за {elapsed:.1f} с ({stats['total'] / max(elapsed, 1e-9):.0f} строк/с)")
+    print(f"Новых товаров: {stats['new_books']}, совпадений: {stats['duplicates']}")
+    print(f"Предложения: новых {stats['offers']}, изменилось {stats['offers_updated']}, "
+          f"без изменений {stats['offers_unchanged']}, устарело {stats['offers_stale']}")
+
 
 if __name__ == "__main__":
-    import_books()
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--input', help='файл книг (*.books, *.jsonl или *.json)')
+    arg_parser.add_argument('--batch-size', type=int, default=1000, help='строк в одном многострочном INSERT')
+    arg_parser.add_argument('--commit-every', type=int, default=10000, help='книг в одной транзакции')
+    arg_parser.add_argument('--threshold', type=float, default=0.75,
+                            help='минимальное сходство названий для нечёткого совпадения (0..1)')
+    arg_parser.add_argument('--processes', type=int, default=0,
+                            help='искать дубли заранее в N процессах (0 — по ходу импорта, в одном)')
+    args = arg_parser.parse_args()
+    import_books(args.input, args.batch_size, args.commit_every, args.threshold, args.processes)
@@ -0,0 +1,108 @@
+"""Приведение ISBN к одному виду: из строки магазина выделяются все ISBN, проверяются
+контрольные цифры, ISBN-10 переводятся в ISBN-13. Одна и та же книга получает одинаковый
+isbn_clean независимо от записи в магазине, и дубли находятся точным сравнением.
+
+Запуск пачкой по набору книг: python isbn.py ../data/all_books_raw.jsonl ../data/all_books_isbn.jsonl
+"""
+import argparse
+import json
+import re
+
+# ISBN-13 или ISBN-10, цифры могут разделяться дефисами и пробелами
+ISBN_RE = re.compile(r'(?<![\dXx])(?:(?:\d[\s-]?){12}\d|(?:\d[\s-]?){9}[\dXx])(?![\dXx])')
+SEPARATORS_RE = re.compile(r'[\s-]')
+
+
+def isbn13_check_digit(first12):
+    total = sum(int(digit) * (3 if position % 2 else 1) for position, digit in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def is_valid_isbn13(isbn):
+    return len(isbn) == 13 and isbn.isdigit() and isbn[:3] in ('978', '979') and \
+        isbn13_check_digit(isbn[:12]) == isbn[12]
+
+
+def is_valid_isbn10(isbn):
+    if len(isbn) != 10 or not isbn[:9].isdigit() or not (isbn[9].isdigit() or isbn[9] in 'Xx'):
+        return False
+    total = sum(int(digit) * (10 - position) for position, digit in enumerate(isbn[:9]))
+    total += 10 if isbn[9] in 'Xx' else int(isbn[9])
+    return total % 11 == 0
+
+
+def isbn10_to_13(isbn10):
+    first12 = '978' + isbn10[:9]
+    return first12 + isbn13_check_digit(first12)
+
+
+def canonical_isbns(text):
+    """Все правильные ISBN из строки в виде ISBN-13, без повторов и в исходном порядке"""
+    if not text:
+        return []
+    result = []
+    for match in ISBN_RE.findall(str(text)):
+        isbn = SEPARATORS_RE.sub('', match)
+        if is_valid_isbn13(isbn):
+            pass
+        elif is_valid_isbn10(isbn):
+            isbn = isbn10_to_13(isbn)
+        else:
+            continue
+        if isbn not in result:
+            result.append(isbn)
+    return result
+
+
+def canonical_isbn(text):
+    """Первый правильный ISBN из строки в виде ISBN-13 или пустая строка"""
+    isbns = canonical_isbns(text)
+    return isbns[0] if isbns else ''
+
+
+def book_isbns(book):
+    """Все ISBN книги: из поля isbn и из уже посчитанного isbn_clean"""
+    isbns = canonical_isbns(book.get('isbn'))
+    for isbn in canonical_isbns(book.get('isbn_clean')):
+        if isbn not in isbns:
+            isbns.append(isbn)
+    return isbns
+
+
+def canonicalize_file(path, output_path):
+    """Пересчитывает isbn_clean для всех книг файла, возвращает счётчики"""
+    # Импорт здесь: merge_data нужен только для пакетного режима
+    from merge_data import iter_books, open_output
+
+    stats = {'books': 0, 'with_isbn': 0, 'several': 0, 'from_isbn10': 0, 'invalid': 0, 'changed': 0}
+    with open_output(output_path) as out_file:
+        for book in iter_books(path):
+            stats['books'] += 1
+            raw = book.get('isbn') or ''
+            isbns = book_isbns(book)
+            found = [SEPARATORS_RE.sub('', match) for match in ISBN_RE.findall(raw)]
+
+            if isbns:
+                stats['with_isbn'] += 1
+            if len(isbns) > 1:
+                stats['several'] += 1
+            stats['from_isbn10'] += sum(1 for isbn in found if len(isbn) == 10 and is_valid_isbn10(isbn))
+            stats['invalid'] += sum(1 for isbn in found if not (is_valid_isbn13(isbn) or is_valid_isbn10(isbn)))
+
+            isbn_clean = isbns[0] if isbns else ''
+            if isbn_clean != (book.get('isbn_clean') or ''):
+                stats['changed'] += 1
+            book['isbn_clean'] = isbn_clean
+            out_file.write(book)
+    return stats
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('path', help='файл книг (*.books, *.jsonl или *.json)')
+    arg_parser.add_argument('output', help='куда сохранить (*.books или *.jsonl)')
+    args = arg_parser.parse_args()
+
+    stats = canonicalize_file(args.path, args.output)
+    print(json.dumps(stats, ensure_ascii=False))
+    print(f"Результат сохранен в {args.output}")
@@ -0,0 +1,288 @@
+import getpass
+import json
+import sqlite3
+import time
+from urllib.parse import unquote, urlparse
+
+
+class JobQueue:
+    """Очередь ссылок на книги в файле SQLite, общая для любого числа процессов-обработчиков одной машины.
+    Для обработчиков на нескольких машинах есть MySQLJobQueue с теми же методами.
+
+    Обработчик берёт ссылки в аренду (lease) на lease_seconds и подтверждает результат (ack).
+    Если обработчик упал, аренда истекает и ссылка снова выдаётся другому, но не больше
+    max_attempts раз. Повторно добавленная ссылка в очередь не попадает."""
+
+    def __init__(self, path, lease_seconds=300, max_attempts=3):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Транзакции открываются явно, чтобы выдача аренды была атомарной
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        # WAL: обработчики читают очередь, не дожидаясь записи других. Работает только на локальном
+        # диске и в пределах одной машины, поэтому файл очереди нельзя класть на сетевой диск
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                url TEXT PRIMARY KEY,
+                shop TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_until REAL,
+                result TEXT,
+                error TEXT,
+                updated_at REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_shop_status ON jobs (shop, status, lease_until)")
+
+    def enqueue(self, shop, urls):
+        """Добавляет ссылки, уже известные очереди пропускаются. Возвращает число новых"""
+        before = self.conn.total_changes
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO jobs (url, shop, updated_at) VALUES (?, ?, ?)",
+            ((url, shop, time.time()) for url in urls)
+        )
+        self.conn.execute("COMMIT")
+        return self.conn.total_changes - before
+
+    def lease(self, worker_id, shop=None, limit=20):
+        """Выдаёт обработчику до limit ссылок: новых или с истёкшей арендой"""
+        now = time.time()
+        shop_filter = "AND shop = ?" if shop else ""
+        shop_params = (shop,) if shop else ()
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Ссылки, которые исчерпали попытки, больше не выдаются
+            self.conn.execute(f"""
+                UPDATE jobs SET status = 'failed', updated_at = ?
+                WHERE status = 'leased' AND lease_until < ? AND attempts >= ? {shop_filter}
+            """, (now, now, self.max_attempts) + shop_params)
+
+            rows = self.conn.execute(f"""
+                SELECT url, shop FROM jobs
+                WHERE (status = 'pending' OR (status = 'leased' AND lease_until < ?)) {shop_filter}
+                LIMIT ?
+            """, (now,) + shop_params + (limit,)).fetchall()
+
+            self.conn.executemany("""
+                UPDATE jobs
+                SET status = 'leased', lease_owner = ?, lease_until = ?, attempts = attempts + 1, updated_at = ?
+                WHERE url = ?
+            """, ((worker_id, now + self.lease_seconds, now, url) for url, _ in rows))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def ack(self, worker_id, url, result):
+        """Сохраняет результат. Если аренда уже перешла к другому обработчику, результат отбрасывается"""
+        cursor = self.conn.execute("""
+            UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_owner = NULL, updated_at = ?
+            WHERE url = ? AND status = 'leased' AND lease_owner = ?
+        """, (json.dumps(result, ensure_ascii=False), time.time(), url, worker_id))
+        return cursor.rowcount == 1
+
+    def fail(self, worker_id, url, error):
+        """Возвращает ссылку в очередь или помечает её проваленной, если попытки кончились"""
+        self.conn.execute("""
+            UPDATE jobs
+            SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                error = ?, lease_owner = NULL, lease_until = NULL, updated_at = ?
+            WHERE url = ? AND status = 'leased' AND lease_owner = ?
+        """, (self.max_attempts, str(error), time.time(), url, worker_id))
+
+    def has_work(self, shop=None):
+        """Есть ли ещё необработанные ссылки, включая арендованные другими обработчиками"""
+        shop_filter = "AND shop = ?" if shop else ""
+        row = self.conn.execute(
+            f"SELECT 1 FROM jobs WHERE status IN ('pending', 'leased') {shop_filter} LIMIT 1",
+            (shop,) if shop else ()
+        ).fetchone()
+        return row is not None
+
+    def stats(self):
+        """Число ссылок по магазинам и статусам: {магазин: {статус: количество}}"""
+        stats = {}
+        for shop, status, count in self.conn.execute(
+                "SELECT shop, status, COUNT(*) FROM jobs GROUP BY shop, status ORDER BY shop, status"):
+            stats.setdefault(shop, {})[status] = count
+        return stats
+
+    def results(self, shop):
+        """Собранные книги магазина по одной, без загрузки всех результатов в память"""
+        for (result,) in self.conn.execute(
+                "SELECT result FROM jobs WHERE shop = ? AND status = 'done' ORDER BY url", (shop,)):
+            yield json.loads(result)
+
+    def close(self):
+        self.conn.close()
+
+
+class MySQLJobQueue:
+    """Очередь ссылок в таблице crawl_jobs MySQL для обработчиков на любом числе машин.
+
+    Методы и поведение те же, что у JobQueue. Аренда выдаётся через SELECT ... FOR UPDATE SKIP LOCKED
+    (MySQL 8): обработчики не ждут друг друга и не получают одну ссылку дважды. Время аренды берётся
+    у сервера, поэтому расхождение часов машин на неё не влияет."""
+
+    def __init__(self, config, lease_seconds=300, max_attempts=3):
+        # mysql.connector нужен только этой очереди, обход с SQLite работает и без него
+        import mysql.connector
+
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.conn = mysql.connector.connect(autocommit=True, charset='utf8mb4', **config)
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS crawl_jobs (
+                url VARCHAR(700) NOT NULL PRIMARY KEY,
+                shop VARCHAR(32) NOT NULL,
+                status VARCHAR(16) NOT NULL DEFAULT 'pending',
+                attempts INT NOT NULL DEFAULT 0,
+                lease_owner VARCHAR(255),
+                lease_until DOUBLE,
+                result MEDIUMTEXT,
+                error TEXT,
+                updated_at DOUBLE,
+                INDEX crawl_jobs_shop_status (shop, status, lease_until)
+            ) CHARACTER SET utf8mb4
+        """)
+        cursor.close()
+
+    def enqueue(self, shop, urls):
+        """Добавляет ссылки, уже известные очереди пропускаются. Возвращает число новых"""
+        rows = [(url, shop) for url in urls]
+        if not rows:
+            return 0
+        cursor = self.conn.cursor()
+        cursor.executemany(
+            "INSERT IGNORE INTO crawl_jobs (url, shop, updated_at) VALUES (%s, %s, UNIX_TIMESTAMP(NOW(6)))",
+            rows
+        )
+        added = cursor.rowcount
+        cursor.close()
+        return added
+
+    def lease(self, worker_id, shop=None, limit=20):
+        """Выдаёт обработчику до limit ссылок: новых или с истёкшей арендой"""
+        shop_filter = "AND shop = %s" if shop else ""
+        shop_params = (shop,) if shop else ()
+
+        cursor = self.conn.cursor()
+        self.conn.start_transaction()
+        try:
+            cursor.execute("SELECT UNIX_TIMESTAMP(NOW(6))")
+            (now,) = cursor.fetchone()
+            now = float(now)
+            # Строки, которые сейчас выдаёт другой обработчик, пропускаются, а не ждут его коммита.
+            # Ссылки с истёкшей арендой, которые исчерпали попытки, больше не выдаются
+            cursor.execute(f"""
+                SELECT url FROM crawl_jobs
+                WHERE status = 'leased' AND lease_until < %s AND attempts >= %s {shop_filter}
+                FOR UPDATE SKIP LOCKED
+            """, (now, self.max_attempts) + shop_params)
+            exhausted = [(now, url) for (url,) in cursor.fetchall()]
+            if exhausted:
+                cursor.executemany("UPDATE crawl_jobs SET status = 'failed', updated_at = %s WHERE url = %s",
+                                   exhausted)
+
+            cursor.execute(f"""
+                SELECT url, shop FROM crawl_jobs
+                WHERE (status = 'pending' OR (status = 'leased' AND lease_until < %s AND attempts < %s))
+                      {shop_filter}
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (now, self.max_attempts) + shop_params + (limit,))
+            rows = cursor.fetchall()
+            if rows:
+                cursor.executemany("""
+                    UPDATE crawl_jobs
+                    SET status = 'leased', lease_owner = %s, lease_until = %s, attempts = attempts + 1,
+                        updated_at = %s
+                    WHERE url = %s
+                """, [(worker_id, now + self.lease_seconds, now, url) for url, _ in rows])
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        return rows
+
+    def ack(self, worker_id, url, result):
+        """Сохраняет результат. Если аренда уже перешла к другому обработчику, результат отбрасывается"""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            UPDATE crawl_jobs
+            SET status = 'done', result = %s, error = NULL, lease_owner = NULL, updated_at = UNIX_TIMESTAMP(NOW(6))
+            WHERE url = %s AND status = 'leased' AND lease_owner = %s
+        """, (json.dumps(result, ensure_ascii=False), url, worker_id))
+        updated = cursor.rowcount == 1
+        cursor.close()
+        return updated
+
+    def fail(self, worker_id, url, error):
+        """Возвращает ссылку в очередь или помечает её проваленной, если попытки кончились"""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            UPDATE crawl_jobs
+            SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+                error = %s, lease_owner = NULL, lease_until = NULL, updated_at = UNIX_TIMESTAMP(NOW(6))
+            WHERE url = %s AND status = 'leased' AND lease_owner = %s
+        """, (self.max_attempts, str(error), url, worker_id))
+        cursor.close()
+
+    def has_work(self, shop=None):
+        """Есть ли ещё необработанные ссылки, включая арендованные другими обработчиками"""
+        shop_filter = "AND shop = %s" if shop else ""
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT 1 FROM crawl_jobs WHERE status IN ('pending', 'leased') {shop_filter} LIMIT 1",
+                       (shop,) if shop else ())
+        row = cursor.fetchone()
+        cursor.close()
+        return row is not None
+
+    def stats(self):
+        """Число ссылок по магазинам и статусам: {магазин: {статус: количество}}"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT shop, status, COUNT(*) FROM crawl_jobs GROUP BY shop, status ORDER BY shop, status")
+        stats = {}
+        for shop, status, count in cursor.fetchall():
+            stats.setdefault(shop, {})[status] = count
+        cursor.close()
+        return stats
+
+    def results(self, shop):
+        """Собранные книги магазина по одной, без загрузки всех результатов в память"""
+        # Небуферизованный курсор читает строки с сервера по мере обхода
+        cursor = self.conn.cursor(buffered=False)
+        try:
+            cursor.execute("SELECT result FROM crawl_jobs WHERE shop = %s AND status = 'done' ORDER BY url", (shop,))
+            for (result,) in cursor:
+                yield json.loads(result)
+        finally:
+            cursor.close()
+
+    def close(self):
+        self.conn.close()
+
+
+def open_queue(location, lease_seconds=300, max_attempts=3):
+    """Очередь по адресу: mysql://пользователь[:пароль]@хост[:порт]/база — MySQLJobQueue,
+    иначе путь к файлу SQLite. Если пароля в адресе нет, он спрашивается при запуске"""
+    if not location.startswith('mysql://'):
+        return JobQueue(location, lease_seconds, max_attempts)
+    url = urlparse(location)
+    config = {
+        'host': url.hostname or 'localhost',
+        'port': url.port or 3306,
+        'user': unquote(url.username or 'root'),
+        'database': url.path.lstrip('/') or 'books_db',
+    }
+    config['password'] = unquote(url.password) if url.password is not None else \
+        getpass.getpass("Введите пароль MySQL: ")
+    return MySQLJobQueue(config, lease_seconds, max_attempts)
@@ -1,45 +1,159 @@
+import argparse
+import hashlib
 import json
 import os
 
-def merge_json_files():
-    # Список файлов для объединения
+from book_format import BookWriter, is_book_file, read_books
+from checkpoint import read_jsonl
+
+JSON_CHUNK_SIZE = 1 << 16
+
+
+def iter_json_array(path):
+    """Элементы JSON-массива из файла по одному, без загрузки всего файла в память"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(JSON_CHUNK_SIZE).lstrip()
+        if not buffer.startswith('['):
+            raise json.JSONDecodeError("ожидался JSON-массив", buffer, 0)
+        buffer = buffer[1:]
+        eof = False
+
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Элемент не поместился в буфер целиком — дочитываем файл
+                chunk = f.read(JSON_CHUNK_SIZE)
+                eof = not chunk
+                buffer += chunk
+                continue
+            yield item
+            buffer = buffer[end:]
+            if len(buffer) < JSON_CHUNK_SIZE and not eof:
+                chunk = f.read(JSON_CHUNK_SIZE)
+                eof = not chunk
+                buffer += chunk
+
+
+def iter_books(path):
+    """Книги из JSON-массива, JSONL или двоичного файла *.books (по расширению) по одной"""
+    if is_book_file(path):
+        return read_books(path)
+    if path.endswith('.jsonl'):
+        return read_jsonl(path)
+    return iter_json_array(path)
+
+
+def url_digest(url):
+    # 16 байт на ссылку вместо самой строки: память на дедупликацию почти не растёт с длиной ссылок
+    return hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+
+
+def find_source(name):
+    """Файл магазина: готовый JSON или JSONL, который пишет парсер во время обхода. Если есть оба,
+    берётся более свежий: JSON от прошлого обхода не должен перекрывать новый недособранный JSONL"""
+    candidates = [filename for filename in (f'{name}.json', f'{name}.jsonl') if os.path.exists(filename)]
+    if not candidates:
+        return None
+    return max(candidates, key=os.path.getmtime)
+
+
+class JsonlOutput:
+    """Итоговый JSONL-файл; в отличие от JsonlWriter не сбрасывает на диск каждую строку"""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+
+    def __enter__(self):
+        self.file = open(self.path, 'w', encoding='utf-8')
+        return self
+
+    def write(self, book):
+        self.file.write(json.dumps(book, ensure_ascii=False) + '\n')
+        self.count += 1
+
+    def __exit__(self, *exc_info):
+        self.file.close()
+
+
+def open_output(path, compress=True):
+    """Писатель результата: двоичный формат для *.books, иначе JSONL"""
+    if is_book_file(path):
+        return BookWriter(path, compress=compress)
+    return JsonlOutput(path)
+
+
+def merge_json_files(output_filename='../data/all_books_raw.jsonl', json_filename=None, compress=True):
+    # Список файлов для объединения (без расширения)
     files_to_merge = [
-        'books_vladivostok.json',
-        'books_labirint.json',
-        'books_bookvoed.json'
+        'books_vladivostok',
+        'books_labirint',
+        'books_bookvoed'
     ]
 
-    all_books = []  # Общий список для всех книг
-
-    # Чтение и объединение данных из каждого файла
-    for filename in files_to_merge:
-        if not os.path.exists(filename):
-            print(f"Файл не найден: {filename}. Пропускаем.")
-            continue
-
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                all_books.extend(data)
-                print(f"Загружено {len(data)} записей из {filename}")
-        except json.JSONDecodeError:
-            print(f"Ошибка: файл {filename} содержит некорректный JSON.")
-        except Exception as e:
-            print(f"Ошибка при чтении файла {filename}: {e}")
-
-    # Сохранение объединенных данных
-    if all_books:
-        try:
-            output_filename = '../data/all_books_raw.json'
-            with open(output_filename, 'w', encoding='utf-8') as out_file:
-                json.dump(all_books, out_file, ensure_ascii=False, indent=2)
-            print(f"\nУспешно. Объединено {len(all_books)} записей.")
-            print(f"Результат сохранен в {output_filename}")
-        except Exception as e:
-            print(f"Ошибка при сохранении файла: {e}")
-    else:
+    seen_urls = set()
+    total = duplicates = 0
+
+    with open_output(output_filename, compress) as out_file:
+        # Чтение и объединение данных из каждого файла
+        for name in files_to_merge:
+            filename = find_source(name)
+            if not filename:
+                print(f"Файл не найден: {name}.json. Пропускаем.")
+                continue
+
+            count = 0
+            try:
+                for book in iter_books(filename):
+                    url = book.get('url')
+                    if url:
+                        digest = url_digest(url)
+                        if digest in seen_urls:
+                            duplicates += 1
+                            continue
+                        seen_urls.add(digest)
+
+                    out_file.write(book)
+                    count += 1
+                print(f"Загружено {count} записей из {filename}")
+            except json.JSONDecodeError:
+                print(f"Ошибка: файл {filename} содержит некорректный JSON.")
+            except Exception as e:
+                print(f"Ошибка при чтении файла {filename}: {e}")
+            total += count
+
+    if not total:
         print("Не удалось загрузить ни одной записи.")
+        return
+
+    print(f"\nУспешно. Объединено {total} записей, пропущено повторов ссылок: {duplicates}.")
+    print(f"Результат сохранен в {output_filename}")
+
+    if json_filename:
+        # Обычный JSON-массив для совместимости, тоже без загрузки всех записей в память
+        with open(json_filename, 'w', encoding='utf-8') as out_file:
+            out_file.write('[')
+            for index, book in enumerate(iter_books(output_filename)):
+                out_file.write(',\n' if index else '\n')
+                out_file.write(json.dumps(book, ensure_ascii=False, indent=2))
+            out_file.write('\n]')
+        print(f"Копия в формате JSON сохранена в {json_filename}")
+
 
 # Точка входа
 if __name__ == "__main__":
-    merge_json_files()
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--output', default='../data/all_books_raw.jsonl',
+                            help='итоговый файл: *.jsonl или двоичный *.books')
+    arg_parser.add_argument('--json', nargs='?', const='../data/all_books_raw.json',
+                            help='дополнительно сохранить результат JSON-массивом')
+    arg_parser.add_argument('--no-compress', action='store_true', help='не сжимать блоки файла *.books')
+    args = arg_parser.parse_args()
+    merge_json_files(args.output, args.json, compress=not args.no_compress)
@@ -1,30 +1,101 @@
 import requests
-from bs4 import BeautifulSoup
+import argparse
 import json
-import time
+import os
 import re
-from urllib.parse import urljoin
+import time
+from urllib.parse import urljoin, urlparse
+
+from checkpoint import compact_jsonl, crawl_to_jsonl
+from crawl_engine import CrawlEngine, is_transient_error
+from crawl_stats import CrawlProfiler, dump_profiles
+from html_backend import make_soup, scope
+from http_cache import CachedSession, PAGE_TTL
+from isbn import canonical_isbn
+from pipeline import ExtractPipeline
+from replay import record, replay
+from sitemap import crawl_sitemap_to_jsonl
 
 
 class ChitaiGorodParser:
-    def __init__(self):
+    SITEMAP_URL = "https://www.chitai-gorod.ru/sitemap.xml"
+    PRODUCT_URL_RE = re.compile(r'/product/')
+
+    # Узлы страниц, которые нужны парсеру; остальная разметка в дерево не попадает
+    DETAIL_RULES = (
+        ('ul', {'class': 'product-authors'}),
+        ('span', {'itemprop': 'isbn'}),
+        ('ul', {'class': 'product-properties'}),
+        ('ul', {'class': 'product-tag-list'}),
+        ('article', {'class': 'product-detail-page__detail-text'}),
+    )
+    PAGE_SCOPES = {
+        'catalog': scope(('article', {'class': 'product-card'})),
+        'detail': scope(*DETAIL_RULES),
+        # При обходе по sitemap со страницы книги берутся ещё название, цена и обложка
+        'product': scope(
+            *DETAIL_RULES,
+            ('h1', {}),
+            (None, {'itemprop': 'price'}),
+            ('meta', {'property': 'og:image'}),
+        ),
+    }
+    PAGE_SCOPES['prices'] = PAGE_SCOPES['catalog']
+
+    def __init__(self, engine=None, cache_dir='.http_cache', html_backend=None, extract_processes=0):
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
         self.base_url = "https://www.chitai-gorod.ru"
-        self.session = requests.Session()
+        self.host = urlparse(self.base_url).netloc
+        self.session = CachedSession(cache_dir)
         self.session.headers.update(self.headers)
-
-    def get_page(self, url, params=None):
+        self.engine = engine or CrawlEngine(max_workers=8, per_host=6, rate=8.0)
+        self.html_backend = html_backend
+        self.profiler = CrawlProfiler(self.base_url)
+        # Адреса, которые не удалось загрузить из-за временной ошибки: обход не считает их собранными
+        self.failed_urls = set()
+        # Разбор детальных страниц в отдельных процессах, если extract_processes > 0
+        self.pipeline = ExtractPipeline(self, extract_processes) if extract_processes else None
+
+    def fetch_html(self, url, params=None, page_type='detail'):
         try:
-            response = self.session.get(url, params=params, timeout=15)
+            ttl = PAGE_TTL[page_type]
+            # Свежий ответ из кэша не расходует лимиты сайта
+            response = self.session.get_fresh(url, params, ttl)
+            if response is not None:
+                self.profiler.count('cache_hits')
+            else:
+                start = time.perf_counter()
+                with self.engine.throttle(url):
+                    self.profiler.add_time('throttle', time.perf_counter() - start)
+                    with self.profiler.timer('network'):
+                        response = self.session.get(url, params=params, timeout=15, ttl=ttl)
+                self.profiler.count('requests')
+                if getattr(response, 'from_cache', False):
+                    self.profiler.count('revalidated')
+                else:
+                    self.profiler.count('bytes', len(response.content))
             response.raise_for_status()
-            return BeautifulSoup(response.text, 'html.parser')
-        except requests.exceptions.RequestException:
+            self.failed_urls.discard(url)
+            return response.text
+        except requests.exceptions.RequestException as e:
+            self.profiler.count('errors.http')
+            if is_transient_error(e):
+                self.failed_urls.add(url)
             return None
         except Exception:
+            self.profiler.count('errors.fetch')
+            self.failed_urls.add(url)
             return None
 
+    def get_page(self, url, params=None, page_type='detail'):
+        markup = self.fetch_html(url, params, page_type)
+        if markup is None:
+            return None
+        with self.profiler.timer('parse'):
+            return make_soup(markup, self.PAGE_SCOPES.get(page_type), self.html_backend)
+
     def parse_book_card(self, card):
         book = {
             'title': '',
@@ -60,11 +131,16 @@ class ChitaiGorodParser:
             if img_elem and img_elem.get('src'):
                 book['image_url'] = img_elem['src']
         except Exception:
-            pass
+            self.profiler.count('errors.card')
 
         return book
 
     def parse_book_details(self, book_url):
+        soup = self.get_page(book_url)
+        with self.profiler.timer('extract'):
+            return self.extract_book_details(soup, book_url)
+
+    def extract_book_details(self, soup, book_url):
         details = {
             'author': '',
             'isbn': '',
@@ -75,7 +151,6 @@ class ChitaiGorodParser:
         }
 
         try:
-            soup = self.get_page(book_url)
             if not soup:
                 return details
 
@@ -134,20 +209,61 @@ class ChitaiGorodParser:
                         full_description) > 200 else full_description
 
         except Exception:
-            pass
+            self.profiler.count('errors.extract')
 
         return details
 
-    def parse_catalog_page(self, page_num):
+    def parse_product(self, book_url):
+        soup = self.get_page(book_url, page_type='product')
+        with self.profiler.timer('extract'):
+            return self.extract_product(soup, book_url)
+
+    def extract_product(self, soup, book_url):
+        """Данные книги только по детальной странице, без карточки каталога (обход по sitemap)"""
+        book = {
+            'title': '',
+            'price': '',
+            'old_price': '',
+            'discount': '',
+            'url': book_url,
+            'image_url': '',
+            'city': 'Владивосток',
+            'source': 'chitai-gorod.ru'
+        }
+
+        try:
+            if soup:
+                title_elem = soup.find('h1')
+                if title_elem:
+                    book['title'] = title_elem.get_text(strip=True)
+
+                price_elem = soup.find(itemprop='price')
+                if price_elem:
+                    # В микроразметке цена лежит в content уже в виде числа
+                    content = price_elem.get('content')
+                    book['price'] = content.strip() if content else self.clean_price(price_elem.get_text(strip=True))
+
+                image_elem = soup.find('meta', property='og:image')
+                if image_elem and image_elem.get('content'):
+                    book['image_url'] = image_elem['content']
+        except Exception:
+            self.profiler.count('errors.extract')
+
+        book.update(self.extract_book_details(soup, book_url))
+        return book
+
+    def parse_catalog_cards(self, page_num, page_type='catalog'):
+        """Карточки книг со страницы каталога, без захода на детальные страницы. None — страница не загрузилась"""
         url = f"{self.base_url}/catalog/books-18030"
         params = {
             'filters[onlyAvailableInCustomerCity]': '1',
             'page': page_num
         }
 
-        soup = self.get_page(url, params)
+        soup = self.get_page(url, params, page_type=page_type)
         if not soup:
-            return []
+            # None, а не пустой список: страница не загрузилась, а не закончился каталог
+            return None
 
         books = []
         product_cards = soup.find_all('article', class_='product-card')
@@ -155,13 +271,32 @@ class ChitaiGorodParser:
         for card in product_cards:
             book = self.parse_book_card(card)
             if book.get('url'):
-                details = self.parse_book_details(book['url'])
-                book.update(details)
                 books.append(book)
-                time.sleep(0.5)
 
         return books
 
+    def fetch_details(self, books):
+        all_details = self.map_details([book['url'] for book in books])
+        for book, details in zip(books, all_details):
+            book.update(details)
+        return books
+
+    def map_details(self, urls):
+        """Данные детальных страниц в порядке urls"""
+        if self.pipeline:
+            return self.pipeline.map(urls)
+        # Детальные страницы загружаются параллельно в пределах лимитов движка
+        return self.engine.map(self.parse_book_details, urls, host=self.host)
+
+    def map_products(self, urls):
+        """Полные данные книг по ссылкам на детальные страницы, в порядке urls"""
+        if self.pipeline:
+            return self.pipeline.map(urls, 'product', 'extract_product')
+        return self.engine.map(self.parse_product, urls, host=self.host)
+
+    def parse_catalog_page(self, page_num):
+        return self.fetch_details(self.parse_catalog_cards(page_num) or [])
+
     def parse_all_pages(self, max_pages=18):
         all_books = []
         for page_num in range(1, max_pages + 1):
@@ -172,9 +307,58 @@ class ChitaiGorodParser:
                 all_books.extend(books)
             except Exception:
                 break
-            time.sleep(1)
         return all_books
 
+    def refresh_prices(self, known_books, max_pages=18):
+        """Быстрое обновление цен: обходит только каталог, детальные страницы
+        загружаются лишь для книг, которых ещё нет в known_books.
+
+        Возвращает все книги known_books с новыми ценами у найденных в каталоге и новые книги. Обход
+        видит только первые max_pages страниц, а known_books может быть полным обходом по sitemap,
+        поэтому остальные книги остаются в списке как есть: отсутствие на этих страницах не значит,
+        что книги нет в продаже, и устаревшими предложения помечает только полный обход.
+        Если страница каталога не загрузилась, возвращается пустой список, и файл не перезаписывается"""
+        books_by_url = {book['url']: book for book in known_books if book.get('url')}
+        refreshed = set()
+        stats = {'updated': 0, 'new': 0}
+
+        for page_num in range(1, max_pages + 1):
+            try:
+                # Цены меняются ежедневно, поэтому каталог всегда перепроверяется
+                cards = self.parse_catalog_cards(page_num, page_type='prices')
+                if cards is None:
+                    print(f"Страница каталога {page_num} не загрузилась, цены не обновлены")
+                    return []
+                if not cards:
+                    break
+
+                new_books = []
+                for card in cards:
+                    known = books_by_url.get(card['url'])
+                    if known:
+                        for field in ('price', 'old_price', 'discount'):
+                            known[field] = card[field]
+                        if card['url'] not in refreshed:
+                            refreshed.add(card['url'])
+                            stats['updated'] += 1
+                    else:
+                        new_books.append(card)
+
+                for book in self.fetch_details(new_books):
+                    if book['url'] in self.failed_urls:
+                        continue
+                    books_by_url[book['url']] = book
+                    refreshed.add(book['url'])
+                    stats['new'] += 1
+            except Exception as e:
+                print(f"Ошибка обновления цен: {e}")
+                self.profiler.count('errors.crawl')
+                return []
+
+        print(f"Обновлено цен: {stats['updated']}, новых книг: {stats['new']}, "
+              f"без обновления: {len(books_by_url) - len(refreshed)}")
+        return list(books_by_url.values())
+
     def clean_price(self, price_text):
         if not price_text:
             return ''
@@ -182,9 +366,8 @@ class ChitaiGorodParser:
         return cleaned.replace(',', '.')
 
     def clean_isbn(self, isbn):
-        if not isbn:
-            return ''
-        return ''.join(filter(str.isdigit, isbn))
+        # Первый правильный ISBN из строки, всегда в виде ISBN-13
+        return canonical_isbn(isbn)
 
     def save_to_json(self, books, filename='books_vladivostok.json'):
         try:
@@ -204,13 +387,74 @@ class ChitaiGorodParser:
 
 
 def main():
-    parser = ChitaiGorodParser()
-    books = parser.parse_all_pages(max_pages=18)
-
-    if books:
-        parser.save_to_json(books, 'books_vladivostok.json')
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--concurrency', type=int, default=6, help='параллельных запросов к сайту')
+    arg_parser.add_argument('--rate', type=float, default=8.0, help='запросов в секунду к сайту')
+    arg_parser.add_argument('--no-cache', action='store_true', help='не использовать дисковый кэш страниц')
+    arg_parser.add_argument('--no-json', action='store_true',
+                            help='оставить результат только в JSONL, без сборки итогового JSON')
+    arg_parser.add_argument('--sitemap', nargs='?', const=ChitaiGorodParser.SITEMAP_URL,
+                            help='обойти все книги магазина по sitemap (URL или локальный файл)')
+    arg_parser.add_argument('--shard-size', type=int, default=200, help='ссылок из sitemap в одной порции')
+    arg_parser.add_argument('--record', metavar='КАТАЛОГ', help='сохранять загруженные страницы для bench_parsers.py')
+    arg_parser.add_argument('--replay', metavar='КАТАЛОГ', help='брать страницы из сохранённых, без сети')
+    arg_parser.add_argument('--profile', metavar='ФАЙЛ', help='сохранить замеры обхода в JSON')
+    arg_parser.add_argument('--processes', type=int, default=0,
+                            help='процессов для разбора детальных страниц (0 — разбор в потоках загрузки)')
+    arg_parser.add_argument('--prices-only', action='store_true',
+                            help='обновить только цены уже собранных книг по страницам каталога')
+    args = arg_parser.parse_args()
+
+    engine = CrawlEngine(max_workers=args.concurrency, per_host=args.concurrency, rate=args.rate)
+    parser = ChitaiGorodParser(
+        engine=engine,
+        cache_dir=None if args.no_cache else '.http_cache',
+        extract_processes=args.processes,
+    )
+    if args.record:
+        record(parser, args.record)
+    if args.replay:
+        replay(parser, args.replay)
+    checkpoint_path = 'books_vladivostok.sitemap.checkpoint.json' if args.sitemap else 'books_vladivostok.checkpoint.json'
+    if args.prices_only:
+        try:
+            with open('books_vladivostok.json', 'r', encoding='utf-8') as f:
+                known_books = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            known_books = []
+        books = parser.refresh_prices(known_books, max_pages=18)
+    elif args.sitemap:
+        _, finished = crawl_sitemap_to_jsonl(parser, args.sitemap, 'books_vladivostok.jsonl', checkpoint_path,
+                                             args.shard_size)
     else:
-        print("Не удалось собрать данные о книгах.")
+        _, finished = crawl_to_jsonl(parser, 'books_vladivostok.jsonl', checkpoint_path, max_pages=18)
+    engine.shutdown()
+    if parser.pipeline:
+        parser.pipeline.shutdown()
+
+    print(parser.profiler.report())
+    if args.profile:
+        dump_profiles([parser.profiler], args.profile)
+
+    if args.prices_only:
+        if books:
+            parser.save_to_json(books, 'books_vladivostok.json')
+        else:
+            print("Не удалось собрать данные о книгах.")
+        return
+
+    if not finished:
+        # Прежний JSON не трогаем: JSONL недособран
+        if os.path.exists(checkpoint_path):
+            print("Обход прерван. Запустите парсер снова, чтобы продолжить с места остановки.")
+        else:
+            print("Не удалось собрать данные о книгах.")
+    elif not args.no_json:
+        total = compact_jsonl('books_vladivostok.jsonl', 'books_vladivostok.json')
+        if total:
+            print(f"Всего собрано книг: {total}")
+        else:
+            print("Не удалось собрать данные о книгах.")
 
 
 if __name__ == "__main__":
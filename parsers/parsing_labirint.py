@@ -1,32 +1,115 @@
 import requests
-from bs4 import BeautifulSoup
+import argparse
 import json
-import time
+import os
 import re
-from urllib.parse import urljoin
+import time
+from urllib.parse import urljoin, urlparse
 from typing import Set
 
+from checkpoint import compact_jsonl, crawl_to_jsonl
+from crawl_engine import CrawlEngine, is_transient_error
+from crawl_stats import CrawlProfiler, dump_profiles
+from html_backend import make_soup, scope
+from http_cache import CachedSession, PAGE_TTL
+from isbn import canonical_isbn
+from pipeline import ExtractPipeline
+from replay import record, replay
+from sitemap import crawl_sitemap_to_jsonl
+
+# Регулярные выражения компилируются один раз, а не на каждой странице
+TITLE_SPLIT_RE = re.compile(r'[:\-–]')
+NON_DIGIT_RE = re.compile(r'[^\d]')
+DISCOUNT_RE = re.compile(r'([–\-]\s*\d+\s*%)')
+WHITESPACE_RE = re.compile(r'\s+')
+AUTHOR_HREF_RE = re.compile(r'/authors/')
+PUBLISHER_HREF_RE = re.compile(r'/pubhouse/')
+GENRE_HREF_RE = re.compile(r'/genres/')
+YEAR_ONLY_RE = re.compile(r'^\d{4}$')
+YEAR_RE = re.compile(r'\b(20\d{2}|19\d{2})\b')
+
 
 class LabirintParser:
-    def __init__(self):
+    SITEMAP_URL = "https://www.labirint.ru/sitemap.xml"
+    PRODUCT_URL_RE = re.compile(r'/books/\d+')
+
+    # Узлы страниц, которые нужны парсеру; остальная разметка в дерево не попадает
+    PAGE_SCOPES = {
+        'catalog': scope(('div', {'class': lambda x: 'product' in x.lower()})),
+        'detail': scope(
+            ('h1', {}),
+            ('section', {'class': 'area-price'}),
+            ('div', {'class': '_wrapper_u86in_1'}),
+            ('meta', {'itemprop': 'isbn'}),
+            ('div', {'id': 'annotation'}),
+            ('div', {'class': lambda x: 'annotation' in x.lower()}),
+            ('img', {'class': '_image_1qke2_7'}),
+        ),
+    }
+
+    def __init__(self, engine=None, cache_dir='.http_cache', html_backend=None, extract_processes=0):
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
         self.base_url = "https://www.labirint.ru"
-        self.session = requests.Session()
+        self.host = urlparse(self.base_url).netloc
+        self.session = CachedSession(cache_dir)
         self.session.headers.update(self.headers)
+        self.engine = engine or CrawlEngine(max_workers=8, per_host=6, rate=8.0)
+        self.html_backend = html_backend
+        self.profiler = CrawlProfiler(self.base_url)
+        # Адреса, которые не удалось загрузить из-за временной ошибки: обход не считает их собранными
+        self.failed_urls = set()
+        # Разбор детальных страниц в отдельных процессах, если extract_processes > 0
+        self.pipeline = ExtractPipeline(self, extract_processes) if extract_processes else None
         self.seen_urls: Set[str] = set()
 
-    def get_page(self, url, params=None):
+    def fetch_html(self, url, params=None, page_type='detail'):
         try:
-            response = self.session.get(url, params=params, timeout=15)
+            ttl = PAGE_TTL[page_type]
+            # Свежий ответ из кэша не расходует лимиты сайта
+            response = self.session.get_fresh(url, params, ttl)
+            if response is not None:
+                self.profiler.count('cache_hits')
+            else:
+                start = time.perf_counter()
+                with self.engine.throttle(url):
+                    self.profiler.add_time('throttle', time.perf_counter() - start)
+                    with self.profiler.timer('network'):
+                        response = self.session.get(url, params=params, timeout=15, ttl=ttl)
+                self.profiler.count('requests')
+                if getattr(response, 'from_cache', False):
+                    self.profiler.count('revalidated')
+                else:
+                    self.profiler.count('bytes', len(response.content))
             response.raise_for_status()
-            return BeautifulSoup(response.text, 'html.parser')
+            self.failed_urls.discard(url)
+            return response.text
+        except requests.exceptions.RequestException as e:
+            self.profiler.count('errors.http')
+            if is_transient_error(e):
+                self.failed_urls.add(url)
+            return None
         except Exception:
+            self.profiler.count('errors.fetch')
+            self.failed_urls.add(url)
             return None
 
+    def get_page(self, url, params=None, page_type='detail'):
+        markup = self.fetch_html(url, params, page_type)
+        if markup is None:
+            return None
+        with self.profiler.timer('parse'):
+            return make_soup(markup, self.PAGE_SCOPES.get(page_type), self.html_backend)
+
     def parse_book_details(self, book_url):
         """Парсинг детальной страницы книги"""
+        soup = self.get_page(book_url)
+        with self.profiler.timer('extract'):
+            return self.extract_book_details(soup, book_url)
+
+    def extract_book_details(self, soup, book_url):
+        """Извлечение данных из уже загруженной детальной страницы"""
         details = {
             'title': '',
             'price': '',
@@ -45,7 +128,6 @@ class LabirintParser:
         }
 
         try:
-            soup = self.get_page(book_url)
             if not soup:
                 return details
 
@@ -53,7 +135,7 @@ class LabirintParser:
             h1 = soup.find('h1', class_='_h1_5o36c_18') or soup.find('h1')
             if h1:
                 title_text = h1.get_text(strip=True)
-                title_text = re.split(r'[:\-–]', title_text)[0].strip()
+                title_text = TITLE_SPLIT_RE.split(title_text)[0].strip()
                 details['title'] = title_text
 
             # Цены и скидка
@@ -63,21 +145,21 @@ class LabirintParser:
                 for elem in price_section.find_all('div', class_='rubl'):
                     elem_classes = elem.get('class', [])
                     if 'text-bold-28-md-32' in elem_classes or 'text-bold-20' in elem_classes:
-                        details['price'] = re.sub(r'[^\d]', '', elem.get_text(strip=True))
+                        details['price'] = NON_DIGIT_RE.sub('', elem.get_text(strip=True))
                         break
 
                 # Старая цена
                 old_price_elem = price_section.find('div', class_='_priceBase_zuu52_19')
                 if old_price_elem:
-                    details['old_price'] = re.sub(r'[^\d]', '', old_price_elem.get_text(strip=True))
+                    details['old_price'] = NON_DIGIT_RE.sub('', old_price_elem.get_text(strip=True))
 
                 # Скидка
                 discount_elem = price_section.find('div', class_='_discount_zuu52_25')
                 if discount_elem:
                     discount_text = discount_elem.get_text(strip=True)
-                    discount_match = re.search(r'([–\-]\s*\d+\s*%)', discount_text)
+                    discount_match = DISCOUNT_RE.search(discount_text)
                     if discount_match:
-                        details['discount'] = re.sub(r'\s+', '', discount_match.group(1))
+                        details['discount'] = WHITESPACE_RE.sub('', discount_match.group(1))
 
                 if not details['discount'] and details['price'] and details['old_price']:
                     try:
@@ -104,30 +186,30 @@ class LabirintParser:
 
                     # Автор
                     if 'автор' in name_text and not details['author']:
-                        author_links = feature.find_all('a', href=re.compile(r'/authors/'))
+                        author_links = feature.find_all('a', href=AUTHOR_HREF_RE)
                         if author_links:
                             authors = [link.get_text(strip=True) for link in author_links]
                             details['author'] = ', '.join(authors)
 
                     # Издательство и год
                     elif 'издательство' in name_text:
-                        publisher_link = feature.find('a', href=re.compile(r'/pubhouse/'))
+                        publisher_link = feature.find('a', href=PUBLISHER_HREF_RE)
                         if publisher_link:
                             details['publisher'] = publisher_link.get_text(strip=True)
 
                         # Год
-                        year_span = feature.find('span', string=re.compile(r'^\d{4}$'))
+                        year_span = feature.find('span', string=YEAR_ONLY_RE)
                         if year_span:
                             details['year'] = year_span.get_text(strip=True)
                         else:
                             all_text = feature.get_text()
-                            year_match = re.search(r'\b(20\d{2}|19\d{2})\b', all_text)
+                            year_match = YEAR_RE.search(all_text)
                             if year_match:
                                 details['year'] = year_match.group(1)
 
                     # Жанр
                     elif 'жанр' in name_text and not details['genre']:
-                        genre_links = feature.find_all('a', href=re.compile(r'/genres/'))
+                        genre_links = feature.find_all('a', href=GENRE_HREF_RE)
                         if genre_links:
                             genres = [link.get_text(strip=True) for link in genre_links]
                             details['genre'] = ', '.join(genres)
@@ -157,7 +239,7 @@ class LabirintParser:
                 details['image_url'] = src
 
         except Exception:
-            pass
+            self.profiler.count('errors.extract')
 
         return details
 
@@ -179,30 +261,48 @@ class LabirintParser:
 
         return None
 
-    def parse_catalog_page(self, page_num):
-        """Парсинг страницы каталога"""
+    def map_details(self, urls):
+        """Данные детальных страниц в порядке urls"""
+        if self.pipeline:
+            return self.pipeline.map(urls)
+        # Детальные страницы загружаются параллельно в пределах лимитов движка
+        return self.engine.map(self.parse_book_details, urls, host=self.host)
+
+    def parse_catalog_cards(self, page_num, page_type='catalog'):
+        """Ссылки на книги со страницы каталога, без захода на детальные страницы. None — страница не загрузилась"""
         url = f"{self.base_url}/books/"
         params = {'available': '1', 'page': page_num}
 
-        soup = self.get_page(url, params)
+        soup = self.get_page(url, params, page_type=page_type)
         if not soup:
-            return []
+            # None, а не пустой список: страница не загрузилась, а не закончился каталог
+            return None
 
-        books = []
         containers = soup.find_all('div', class_='_product_wduds_1')
 
         if not containers:
             containers = soup.find_all('div', class_=lambda x: x and 'product' in str(x).lower())
 
+        cards = []
         for container in containers:
             book_basic = self.parse_book_card(container)
 
             if book_basic and book_basic.get('url'):
-                details = self.parse_book_details(book_basic['url'])
-                books.append(details)
-                time.sleep(0.3)
+                cards.append(book_basic)
+
+        return cards
+
+    def fetch_details(self, cards):
+        # Все данные книги берутся с детальной страницы
+        return self.map_details([card['url'] for card in cards])
 
-        return books
+    def map_products(self, urls):
+        # Детальная страница Лабиринта и так содержит все данные книги
+        return self.map_details(urls)
+
+    def parse_catalog_page(self, page_num):
+        """Парсинг страницы каталога"""
+        return self.fetch_details(self.parse_catalog_cards(page_num) or [])
 
     def parse_all_pages(self, max_pages=18):
         """Парсинг всех страниц"""
@@ -216,14 +316,12 @@ class LabirintParser:
                 all_books.extend(books)
             except Exception:
                 break
-            time.sleep(1)
 
         return all_books
 
     def clean_isbn(self, isbn):
-        if not isbn:
-            return ''
-        return ''.join(filter(str.isdigit, isbn))
+        # Первый правильный ISBN из строки, всегда в виде ISBN-13
+        return canonical_isbn(isbn)
 
     def save_to_json(self, books, filename='books_labirint.json'):
         try:
@@ -243,13 +341,58 @@ class LabirintParser:
 
 
 def main():
-    parser = LabirintParser()
-    books = parser.parse_all_pages(max_pages=18)
-
-    if books:
-        parser.save_to_json(books, 'books_labirint.json')
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--concurrency', type=int, default=6, help='параллельных запросов к сайту')
+    arg_parser.add_argument('--rate', type=float, default=8.0, help='запросов в секунду к сайту')
+    arg_parser.add_argument('--no-cache', action='store_true', help='не использовать дисковый кэш страниц')
+    arg_parser.add_argument('--no-json', action='store_true',
+                            help='оставить результат только в JSONL, без сборки итогового JSON')
+    arg_parser.add_argument('--sitemap', nargs='?', const=LabirintParser.SITEMAP_URL,
+                            help='обойти все книги магазина по sitemap (URL или локальный файл)')
+    arg_parser.add_argument('--shard-size', type=int, default=200, help='ссылок из sitemap в одной порции')
+    arg_parser.add_argument('--record', metavar='КАТАЛОГ', help='сохранять загруженные страницы для bench_parsers.py')
+    arg_parser.add_argument('--replay', metavar='КАТАЛОГ', help='брать страницы из сохранённых, без сети')
+    arg_parser.add_argument('--profile', metavar='ФАЙЛ', help='сохранить замеры обхода в JSON')
+    arg_parser.add_argument('--processes', type=int, default=0,
+                            help='процессов для разбора детальных страниц (0 — разбор в потоках загрузки)')
+    args = arg_parser.parse_args()
+
+    engine = CrawlEngine(max_workers=args.concurrency, per_host=args.concurrency, rate=args.rate)
+    parser = LabirintParser(
+        engine=engine,
+        cache_dir=None if args.no_cache else '.http_cache',
+        extract_processes=args.processes,
+    )
+    if args.record:
+        record(parser, args.record)
+    if args.replay:
+        replay(parser, args.replay)
+    checkpoint_path = 'books_labirint.sitemap.checkpoint.json' if args.sitemap else 'books_labirint.checkpoint.json'
+    if args.sitemap:
+        _, finished = crawl_sitemap_to_jsonl(parser, args.sitemap, 'books_labirint.jsonl', checkpoint_path,
+                                             args.shard_size)
     else:
-        print("Не удалось собрать данные о книгах.")
+        _, finished = crawl_to_jsonl(parser, 'books_labirint.jsonl', checkpoint_path, max_pages=18)
+    engine.shutdown()
+    if parser.pipeline:
+        parser.pipeline.shutdown()
+
+    print(parser.profiler.report())
+    if args.profile:
+        dump_profiles([parser.profiler], args.profile)
+
+    if not finished:
+        # Прежний JSON не трогаем: JSONL недособран
+        if os.path.exists(checkpoint_path):
+            print("Обход прерван. Запустите парсер снова, чтобы продолжить с места остановки.")
+        else:
+            print("Не удалось собрать данные о книгах.")
+    elif not args.no_json:
+        total = compact_jsonl('books_labirint.jsonl', 'books_labirint.json')
+        if total:
+            print(f"Всего собрано книг: {total}")
+        else:
+            print("Не удалось собрать данные о книгах.")
 
 
 if __name__ == "__main__":
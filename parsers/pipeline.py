@@ -0,0 +1,115 @@
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from html_backend import make_soup
+
+# Экземпляр парсера внутри процесса-обработчика, создаётся один раз при запуске процесса
+_worker_parser = None
+
+
+def _init_worker(parser_cls, html_backend):
+    global _worker_parser
+    _worker_parser = parser_cls(cache_dir=None, html_backend=html_backend)
+
+
+def _extract(markup, book_url, page_type, extractor):
+    """Разбор страницы в процессе-обработчике. Кроме данных книги возвращает время
+    построения дерева и извлечения и счётчики ошибок — их учитывает профиль основного процесса"""
+    _worker_parser.profiler.counters.clear()
+    start = time.perf_counter()
+    soup = make_soup(markup, _worker_parser.PAGE_SCOPES[page_type], _worker_parser.html_backend)
+    parsed = time.perf_counter()
+    result = getattr(_worker_parser, extractor)(soup, book_url)
+    extracted = time.perf_counter()
+    return result, parsed - start, extracted - parsed, dict(_worker_parser.profiler.counters)
+
+
+class ExtractPipeline:
+    """Двухэтапная обработка детальных страниц: потоки движка скачивают HTML,
+    пул процессов разбирает его в словари книг. Этапы связаны ограниченной очередью,
+    поэтому в памяти одновременно не больше max_pending скачанных страниц на каждом этапе"""
+
+    def __init__(self, parser, processes=None, max_pending=32):
+        self.parser = parser
+        self.max_pending = max_pending
+        self.pool = ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=_init_worker,
+            initargs=(type(parser), parser.html_backend),
+        )
+
+    def map(self, urls, page_type='detail', extractor='extract_book_details'):
+        """Данные страниц в порядке urls. extractor — имя метода парсера, принимающего (soup, url)"""
+        urls = list(urls)
+        results = [None] * len(urls)
+        downloaded = queue.Queue(maxsize=self.max_pending)
+        # Выставляется, если разбор упал: оставшиеся страницы не скачиваются, а загрузчики
+        # не ждут вечно места в очереди, которую больше никто не читает
+        stopped = threading.Event()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    downloaded.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def download(item):
+            index, url = item
+            if not stopped.is_set():
+                put((index, url, self.parser.fetch_html(url, page_type=page_type)))
+
+        def produce():
+            try:
+                self.parser.engine.map(download, enumerate(urls), host=self.parser.host)
+            finally:
+                put(None)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+
+        pending = set()
+        try:
+            while True:
+                item = downloaded.get()
+                if item is None:
+                    break
+                index, url, markup = item
+                if markup is None:
+                    results[index] = getattr(self.parser, extractor)(None, url)
+                    continue
+
+                future = self.pool.submit(_extract, markup, url, page_type, extractor)
+                future.index = index
+                pending.add(future)
+                if len(pending) >= self.max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        results[future.index] = self._collect(future)
+
+            for future in pending:
+                results[future.index] = self._collect(future)
+        except BaseException:
+            # Например, BrokenProcessPool после падения процесса-обработчика
+            stopped.set()
+            for future in pending:
+                future.cancel()
+            producer.join()
+            raise
+
+        producer.join()
+        return results
+
+    def _collect(self, future):
+        result, parse_time, extract_time, counters = future.result()
+        profiler = self.parser.profiler
+        profiler.add_time('parse', parse_time)
+        profiler.add_time('extract', extract_time)
+        profiler.merge_counters(counters)
+        return result
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
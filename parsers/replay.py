@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import threading
+
+import requests
+
+
+def request_key(url, params=None):
+    full_url = requests.Request('GET', url, params=params).prepare().url
+    return full_url, hashlib.sha256(full_url.encode('utf-8')).hexdigest()
+
+
+class FixtureStore:
+    """Сохранённые ответы сайта: <key>.html с разметкой и index.jsonl со списком страниц"""
+
+    def __init__(self, fixtures_dir):
+        self.fixtures_dir = fixtures_dir
+        self.index_path = os.path.join(fixtures_dir, 'index.jsonl')
+        self.lock = threading.Lock()
+
+    def save(self, url, params, page_type, markup):
+        full_url, key = request_key(url, params)
+        os.makedirs(self.fixtures_dir, exist_ok=True)
+        with open(os.path.join(self.fixtures_dir, key + '.html'), 'w', encoding='utf-8') as f:
+            f.write(markup)
+        with self.lock, open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'key': key,
+                'url': full_url,
+                'page_type': page_type,
+                'page': (params or {}).get('page'),
+            }, ensure_ascii=False) + '\n')
+
+    def load(self, url, params=None):
+        _, key = request_key(url, params)
+        try:
+            with open(os.path.join(self.fixtures_dir, key + '.html'), 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def entries(self):
+        """Записанные страницы без повторов, в порядке записи"""
+        if not os.path.exists(self.index_path):
+            return []
+        entries = {}
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries.setdefault(entry['key'], entry)
+        return list(entries.values())
+
+
+def record(parser, fixtures_dir):
+    """Сохраняет каждую загруженную парсером страницу в fixtures_dir"""
+    store = FixtureStore(fixtures_dir)
+    fetch_html = parser.fetch_html
+
+    def recording_fetch_html(url, params=None, page_type='detail'):
+        markup = fetch_html(url, params, page_type)
+        if markup is not None:
+            store.save(url, params, page_type, markup)
+        return markup
+
+    parser.fetch_html = recording_fetch_html
+    return store
+
+
+def replay(parser, fixtures_dir):
+    """Отдаёт парсеру страницы только из fixtures_dir, без обращений к сети"""
+    store = FixtureStore(fixtures_dir)
+
+    def replaying_fetch_html(url, params=None, page_type='detail'):
+        markup = store.load(url, params)
+        if markup is None:
+            # Как сбой загрузки при обходе: обход не запишет пустую книгу и не сочтёт страницу готовой
+            parser.profiler.count('errors.replay')
+            parser.failed_urls.add(url)
+        else:
+            parser.failed_urls.discard(url)
+        return markup
+
+    parser.fetch_html = replaying_fetch_html
+    return store
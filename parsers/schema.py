@@ -0,0 +1,368 @@
+"""Схема БД books_db с номерами версий.
+
+Каждая миграция — функция с номером; применённые номера хранятся в таблице schema_version.
+migrate() выполняет только новые миграции, а каждая из них сама проверяет, что уже есть в БД
+(таблица, столбец, индекс), поэтому повторный запуск и запуск на таблицах, созданных вручную,
+ничего не ломают. В MySQL изменения схемы фиксируются сразу, без транзакции, и миграция,
+прерванная на середине, при следующем запуске просто доделывается.
+
+Запуск:
+  python schema.py migrate   — создать или обновить схему
+  python schema.py status    — какие миграции применены
+  python schema.py prices    — пересчитать сводку цен всех товаров (после ручной правки offers)
+  python schema.py explain   — EXPLAIN запросов сайта (django_project/books/queries.py): ни один
+                               из них не должен читать products или offers целиком
+
+Тестов в проекте нет, а планы запросов зависят от живой MySQL с индексами и данными, поэтому
+проверка планов — команда, а не тест. Её запускают после изменения queries.py или миграций;
+при замечаниях она завершается с кодом 1, так что годится и для сценария проверки перед выкладкой.
+"""
+import argparse
+import getpass
+import importlib.util
+import os
+import sys
+
+import mysql.connector
+from mysql.connector import Error
+
+from isbn import canonical_isbn, canonical_isbns
+
+QUERIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', 'django_project', 'books', 'queries.py')
+
+# Нормализованное название считается самой БД так же, как normalize_for_comparison() в fuzzy_match.py:
+# нижний регистр, без скобок, знаки препинания заменены пробелами, пробелы схлопнуты
+TITLE_NORMALIZED_SQL = r"""
+    TRIM(REGEXP_REPLACE(REGEXP_REPLACE(REGEXP_REPLACE(LOWER(canonical_name),
+        '\\([^)]*\\)', ''), '[^\\w\\s]', ' '), '\\s+', ' '))
+"""
+
+
+def table_exists(cursor, table):
+    cursor.execute("""
+        SELECT COUNT(*) AS found FROM INFORMATION_SCHEMA.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    return bool(cursor.fetchone()['found'])
+
+
+def column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT COUNT(*) AS found FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return bool(cursor.fetchone()['found'])
+
+
+def index_exists(cursor, table, index):
+    cursor.execute("""
+        SELECT COUNT(*) AS found FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, index))
+    return bool(cursor.fetchone()['found'])
+
+
+def add_column(cursor, table, column, definition):
+    if not column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def add_index(cursor, table, index, columns, unique=False):
+    if not index_exists(cursor, table, index):
+        cursor.execute(f"ALTER TABLE {table} ADD {'UNIQUE KEY' if unique else 'KEY'} {index} ({columns})")
+
+
+def add_ngram_index(cursor, table, index, columns):
+    """Полнотекстовый индекс с парсером ngram: текст режется на пары символов (ngram_token_size)"""
+    if not index_exists(cursor, table, index):
+        cursor.execute(f"ALTER TABLE {table} ADD FULLTEXT INDEX {index} ({columns}) WITH PARSER ngram")
+
+
+def create_tables(cursor):
+    """Таблицы товаров и предложений, как на схеме img/img.png"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS products (
+            id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+            canonical_name VARCHAR(500) NOT NULL DEFAULT '',
+            author VARCHAR(500) NOT NULL DEFAULT '',
+            isbn_clean VARCHAR(20) NULL,
+            publisher VARCHAR(255) NULL,
+            year INT NULL,
+            genre VARCHAR(255) NULL,
+            description TEXT NULL,
+            image_url TEXT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS offers (
+            id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+            product_id INT NOT NULL,
+            website_name VARCHAR(100) NOT NULL,
+            price DECIMAL(10, 2) NULL,
+            old_price DECIMAL(10, 2) NULL,
+            discount VARCHAR(50) NULL,
+            url TEXT NULL,
+            city VARCHAR(100) NULL,
+            date_parsed TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT offers_product FOREIGN KEY (product_id) REFERENCES products (id)
+        ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci
+    """)
+
+
+def add_offer_state(cursor):
+    """Столбцы для обновления предложений при повторном импорте"""
+    add_column(cursor, 'offers', 'is_stale', "TINYINT(1) NOT NULL DEFAULT 0")
+    add_column(cursor, 'offers', 'last_changed_at', "TIMESTAMP NULL DEFAULT NULL")
+
+
+def create_product_isbns(cursor):
+    """Таблица всех ISBN товаров. При создании заполняется из products.isbn_clean"""
+    if table_exists(cursor, 'product_isbns'):
+        return
+    cursor.execute("""
+        CREATE TABLE product_isbns (
+            isbn CHAR(13) NOT NULL PRIMARY KEY,
+            product_id INT NOT NULL,
+            KEY product_isbns_product (product_id)
+        )
+    """)
+    cursor.execute("SELECT id, isbn_clean FROM products WHERE isbn_clean IS NOT NULL AND isbn_clean <> '' "
+                   "ORDER BY id")
+    rows = [(isbn, row['id']) for row in cursor.fetchall() for isbn in canonical_isbns(row['isbn_clean'])]
+    if rows:
+        cursor.executemany("INSERT IGNORE INTO product_isbns (isbn, product_id) VALUES (%s, %s)", rows)
+
+
+def add_query_indexes(cursor):
+    """Индексы для запросов сайта и уникальный isbn_clean.
+
+    Перед уникальным ключом isbn_clean приводится к ISBN-13 (isbn.py), пустые и неверные значения
+    становятся NULL, а у повторов ISBN остаётся только в товаре с наименьшим id: остальные товары
+    по-прежнему находятся по нему через product_isbns"""
+    cursor.execute("SELECT id, isbn_clean FROM products WHERE isbn_clean IS NOT NULL ORDER BY id")
+    owners = set()
+    updates = []
+    for row in cursor.fetchall():
+        isbn = canonical_isbn(row['isbn_clean']) or None
+        if isbn in owners:
+            isbn = None
+        elif isbn:
+            owners.add(isbn)
+        if isbn != row['isbn_clean']:
+            updates.append((isbn, row['id']))
+    if updates:
+        cursor.executemany("UPDATE products SET isbn_clean = %s WHERE id = %s", updates)
+    cursor.execute("ALTER TABLE products MODIFY isbn_clean CHAR(13) NULL")
+
+    add_index(cursor, 'products', 'products_isbn_clean', "isbn_clean", unique=True)
+    add_index(cursor, 'products', 'products_created_at', "created_at")
+    add_index(cursor, 'offers', 'offers_product_price', "product_id, price")
+
+
+def add_title_normalized(cursor):
+    """Нормализованное название — хранимый вычисляемый столбец с индексом: точное сравнение
+    и поиск по началу названия (LIKE 'текст%') идут по индексу"""
+    add_column(cursor, 'products', 'title_normalized',
+               f"VARCHAR(500) AS ({TITLE_NORMALIZED_SQL}) STORED")
+    add_index(cursor, 'products', 'products_title_normalized', "title_normalized")
+
+
+# Сводка цен товара по его действующим предложениям. best_offer_id — самое дешёвое (при равной
+# цене — более раннее), его находит индекс offers(product_id, price)
+REFRESH_PRICES_SQL = """
+    UPDATE products p
+    LEFT JOIN (
+        SELECT product_id, MIN(price) AS min_price, MAX(price) AS max_price, COUNT(*) AS offers_count
+        FROM offers WHERE is_stale = 0 {offers_filter} GROUP BY product_id
+    ) s ON s.product_id = p.id
+    SET p.min_price = s.min_price,
+        p.max_price = s.max_price,
+        p.offers_count = COALESCE(s.offers_count, 0),
+        p.best_offer_id = (
+            SELECT o.id FROM offers o
+            WHERE o.product_id = p.id AND o.is_stale = 0 AND o.price IS NOT NULL
+            ORDER BY o.price, o.id LIMIT 1
+        )
+    {products_filter}
+"""
+
+
+def refresh_prices(cursor, product_ids=None, chunk_size=1000):
+    """Пересчитывает min_price, max_price, offers_count и best_offer_id у указанных товаров
+    (None — у всех)"""
+    if product_ids is None:
+        cursor.execute(REFRESH_PRICES_SQL.format(offers_filter='', products_filter=''))
+        return
+    product_ids = sorted(product_ids)
+    for start in range(0, len(product_ids), chunk_size):
+        chunk = product_ids[start:start + chunk_size]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        cursor.execute(REFRESH_PRICES_SQL.format(offers_filter=f"AND product_id IN ({placeholders})",
+                                                 products_filter=f"WHERE p.id IN ({placeholders})"),
+                       chunk + chunk)
+
+
+def add_price_summary(cursor):
+    """Сводка цен прямо в products: страницы списков читают её без JOIN и GROUP BY по offers"""
+    add_column(cursor, 'products', 'min_price', "DECIMAL(10, 2) NULL")
+    add_column(cursor, 'products', 'max_price', "DECIMAL(10, 2) NULL")
+    add_column(cursor, 'products', 'offers_count', "INT NOT NULL DEFAULT 0")
+    add_column(cursor, 'products', 'best_offer_id', "INT NULL")
+    refresh_prices(cursor)
+
+
+def add_search_indexes(cursor):
+    """Полнотекстовые индексы для поиска на сайте (django_project/books/search_backend.py): по названию
+    отдельно, чтобы совпадение в нём весило больше, и по названию, автору и издательству вместе"""
+    add_ngram_index(cursor, 'products', 'products_search_title', "canonical_name")
+    add_ngram_index(cursor, 'products', 'products_search', "canonical_name, author, publisher")
+
+
+def bump_dataset_version(cursor):
+    """Новая версия данных: кэш сайта (django_project/books/cache.py) перестаёт использовать
+    записи старой. Вызывается в той же транзакции, что и изменение данных"""
+    cursor.execute("UPDATE dataset_version SET version = version + 1, changed_at = NOW() WHERE id = 1")
+
+
+def create_dataset_version(cursor):
+    """Таблица с одной строкой — версией данных для кэша сайта"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS dataset_version (
+            id TINYINT NOT NULL PRIMARY KEY,
+            version BIGINT NOT NULL,
+            changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("INSERT IGNORE INTO dataset_version (id, version) VALUES (1, 1)")
+
+
+# Номера не меняются и не переиспользуются, новые миграции добавляются в конец
+MIGRATIONS = [
+    (1, 'Таблицы products и offers', create_tables),
+    (2, 'offers.is_stale и offers.last_changed_at', add_offer_state),
+    (3, 'Таблица product_isbns', create_product_isbns),
+    (4, 'Уникальный isbn_clean, индексы offers(product_id, price) и products(created_at)', add_query_indexes),
+    (5, 'Вычисляемый столбец products.title_normalized с индексом', add_title_normalized),
+    (6, 'Сводка цен в products: min_price, max_price, offers_count, best_offer_id', add_price_summary),
+    (7, 'Полнотекстовые индексы ngram для поиска', add_search_indexes),
+    (8, 'Таблица dataset_version для кэша сайта', create_dataset_version),
+]
+
+
+def applied_versions(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT NOT NULL PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_version")
+    return {row['version'] for row in cursor.fetchall()}
+
+
+def migrate(conn):
+    """Применяет недостающие миграции по порядку, возвращает список применённых номеров"""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        done = applied_versions(cursor)
+        applied = []
+        for version, description, apply in MIGRATIONS:
+            if version in done:
+                continue
+            apply(cursor)
+            cursor.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                           (version, description))
+            conn.commit()
+            applied.append(version)
+            print(f"Миграция {version}: {description}")
+        return applied
+    finally:
+        cursor.close()
+
+
+def load_queries():
+    """Модуль запросов сайта; грузится по пути, чтобы не требовать Django"""
+    spec = importlib.util.spec_from_file_location('books_queries', QUERIES_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def explain_problems(cursor, sql, params, full_scan_ok=()):
+    """Строки EXPLAIN и список замечаний: полное чтение таблицы, которому разрешено не быть"""
+    cursor.execute(f"EXPLAIN {sql}", params)
+    rows = cursor.fetchall()
+    problems = [f"полное чтение {row['table']}" for row in rows
+                if row['type'] == 'ALL' and row['table'] in ('products', 'offers')
+                and row['table'] not in full_scan_ok]
+    return rows, problems
+
+
+def check_queries(conn):
+    """EXPLAIN всех запросов из EXPLAIN_CHECKS, возвращает число запросов с замечаниями"""
+    queries = load_queries()
+    cursor = conn.cursor(dictionary=True)
+    failed = 0
+    try:
+        for name, sql, params, full_scan_ok in queries.EXPLAIN_CHECKS:
+            rows, problems = explain_problems(cursor, sql, params, full_scan_ok)
+            print(f"{'ОШИБКА' if problems else 'ok':<8}{name}")
+            for row in rows:
+                print(f"        {row['table']}: type={row['type']}, key={row['key']}, rows={row['rows']}, "
+                      f"{row['Extra'] or ''}")
+            for problem in problems:
+                print(f"        {problem}")
+            failed += bool(problems)
+    finally:
+        cursor.close()
+    return failed
+
+
+def show_status(conn):
+    cursor = conn.cursor(dictionary=True)
+    try:
+        done = applied_versions(cursor)
+    finally:
+        cursor.close()
+    for version, description, _ in MIGRATIONS:
+        print(f"{'+' if version in done else '-'} {version}: {description}")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('command', choices=['migrate', 'status', 'prices', 'explain'])
+    args = arg_parser.parse_args()
+
+    password = getpass.getpass("Введите пароль MySQL: ")
+    try:
+        conn = mysql.connector.connect(
+            host='localhost',
+            user='root',
+            password=password,
+            database='books_db',
+            charset='utf8mb4'
+        )
+    except Error as e:
+        print(f"Не удалось подключиться к MySQL: {e}")
+        sys.exit(1)
+
+    try:
+        if args.command == 'migrate':
+            applied = migrate(conn)
+            print(f"Применено миграций: {len(applied)}" if applied else "Схема уже актуальна")
+        elif args.command == 'status':
+            show_status(conn)
+        elif args.command == 'prices':
+            cursor = conn.cursor()
+            refresh_prices(cursor)
+            bump_dataset_version(cursor)
+            conn.commit()
+            cursor.close()
+            print("Сводка цен пересчитана")
+        elif check_queries(conn):
+            sys.exit(1)
+    finally:
+        conn.close()
@@ -0,0 +1,180 @@
+import gzip
+import hashlib
+import os
+import xml.etree.ElementTree as ET
+from urllib.parse import urljoin
+
+from checkpoint import CrawlCheckpoint, JsonlWriter, finish_checkpoint
+
+
+def is_remote(location):
+    return location.startswith(('http://', 'https://'))
+
+
+def open_sitemap(location, session=None):
+    """Поток байтов sitemap из файла или по URL; .gz распаковывается на лету"""
+    if is_remote(location):
+        response = session.get(location, stream=True, timeout=30)
+        response.raise_for_status()
+        response.raw.decode_content = True
+        stream = response.raw
+    else:
+        stream = open(location, 'rb')
+
+    if location.endswith('.gz'):
+        return gzip.GzipFile(fileobj=stream)
+    return stream
+
+
+def iter_locs(stream):
+    """Пары (тип, адрес) из sitemapindex или urlset. Разбор потоковый:
+    обработанные элементы сразу удаляются, поэтому размер файла не влияет на память"""
+    root = None
+    loc = None
+    for event, elem in ET.iterparse(stream, events=('start', 'end')):
+        if root is None:
+            root = elem
+        if event != 'end':
+            continue
+
+        tag = elem.tag.rsplit('}', 1)[-1]
+        if tag == 'loc':
+            loc = (elem.text or '').strip()
+        elif tag in ('sitemap', 'url'):
+            if loc:
+                yield tag, loc
+            loc = None
+            root.clear()
+
+
+def iter_sitemap_urls(location, product_re, session=None, skip=()):
+    """Пары (адрес sitemap, ссылка на книгу), включая вложенные sitemap из индекса. После ссылок
+    каждого конечного sitemap (urlset) идёт пара (адрес, None). Вложенные sitemap из skip не загружаются"""
+    stream = open_sitemap(location, session)
+    has_children = False
+    try:
+        for kind, loc in iter_locs(stream):
+            if kind == 'sitemap':
+                has_children = True
+                if not is_remote(location) and not is_remote(loc):
+                    loc = os.path.join(os.path.dirname(location), loc)
+                elif is_remote(location):
+                    loc = urljoin(location, loc)
+                if loc not in skip:
+                    yield from iter_sitemap_urls(loc, product_re, session, skip)
+            elif product_re.search(loc):
+                yield location, loc
+    finally:
+        stream.close()
+    if not has_children:
+        yield location, None
+
+
+def iter_product_urls(location, product_re, session=None):
+    """Ссылки на книги из sitemap, включая вложенные sitemap из индекса"""
+    for _, url in iter_sitemap_urls(location, product_re, session):
+        if url is not None:
+            yield url
+
+
+def shard(urls, size):
+    """Разбивает поток ссылок на порции по size штук"""
+    batch = []
+    for url in urls:
+        batch.append(url)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def shard_digest(urls):
+    """Отпечаток порции ссылок: после изменения sitemap у сдвинувшейся порции он другой"""
+    return hashlib.blake2b('\n'.join(urls).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def crawl_sitemap_to_jsonl(parser, location, jsonl_path, checkpoint_path, shard_size=200, on_book=None):
+    """Обход всех книг магазина по sitemap с записью в JSONL.
+
+    Ссылки читаются из sitemap потоком и обрабатываются порциями по shard_size внутри каждого
+    вложенного sitemap. В контрольной точке сохраняются адреса полностью обработанных вложенных
+    sitemap (при продолжении они даже не загружаются) и отпечатки готовых порций. Если sitemap
+    изменился между запусками, порции с другим составом ссылок просто загружаются заново.
+
+    Книги, которые не загрузились, не записываются: их порция остаётся неготовой, а уже записанные
+    книги порции сохраняются в контрольной точке. После полного обхода контрольная точка удаляется.
+    Возвращает число записанных книг и признак полного обхода."""
+    checkpoint = CrawlCheckpoint(checkpoint_path)
+    if checkpoint.exists:
+        print(f"Продолжение обхода по sitemap: готово sitemap {len(checkpoint.completed_sitemaps)}, "
+              f"порций {len(checkpoint.completed_shards)}")
+
+    count = 0
+    finished = True
+
+    def crawl_shard(batch):
+        """Обходит порцию; True, если все её книги записаны"""
+        nonlocal count
+        digest = shard_digest(batch)
+        if digest in checkpoint.completed_shards:
+            return True
+        pending = [url for url in batch if url not in checkpoint.seen_urls]
+        urls = []
+        for book in parser.map_products(pending):
+            if book['url'] in parser.failed_urls:
+                continue
+            if book.get('isbn'):
+                book['isbn_clean'] = parser.clean_isbn(book['isbn'])
+            writer.write(book)
+            if on_book:
+                on_book(book)
+            urls.append(book['url'])
+            count += 1
+        if len(urls) < len(pending):
+            # Порция не готова: запоминаем записанные ссылки, чтобы не скачивать их снова
+            checkpoint.seen_urls.update(urls)
+            checkpoint.save()
+            return False
+        # Ссылки из sitemap уникальны, поэтому у готовой порции их хранить не нужно
+        checkpoint.seen_urls.difference_update(batch)
+        checkpoint.completed_shards.add(digest)
+        checkpoint.save()
+        return True
+
+    with JsonlWriter(jsonl_path, append=checkpoint.exists) as writer:
+        try:
+            batch = []
+            digests = []
+            sitemap_done = True
+            urls = iter_sitemap_urls(location, parser.PRODUCT_URL_RE, parser.session,
+                                     skip=checkpoint.completed_sitemaps)
+            for sitemap, url in urls:
+                if url is not None:
+                    batch.append(url)
+                    if len(batch) < shard_size:
+                        continue
+                if batch:
+                    digests.append(shard_digest(batch))
+                    sitemap_done = crawl_shard(batch) and sitemap_done
+                    batch = []
+                if url is None:
+                    # Вложенный sitemap прочитан до конца
+                    if sitemap_done:
+                        checkpoint.completed_sitemaps.add(sitemap)
+                        checkpoint.completed_shards.difference_update(digests)
+                        checkpoint.save()
+                    else:
+                        finished = False
+                    digests = []
+                    sitemap_done = True
+        except Exception as e:
+            print(f"Ошибка обхода по sitemap: {e}")
+            parser.profiler.count('errors.crawl')
+            finished = False
+        except BaseException:
+            finished = False
+            raise
+        finally:
+            finish_checkpoint(checkpoint, finished, count)
+    return count, finished